@@ -0,0 +1,140 @@
+# Asyncio variants of the item pipelines.
+#
+# They require TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
+# and never block the event loop: DB transactions and Excel files are written in threads.
+# See: https://docs.scrapy.org/en/latest/topics/coroutines.html
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from sqlite3 import IntegrityError
+
+import scrapy
+from scrapy.crawler import Crawler
+from scrapy.exceptions import DropItem
+from scrapy.utils.defer import deferred_from_coro
+
+from blocket.db import IdCache, execute_statements, insert_job_statements
+from blocket.pipelines import ExcelSavePipeline, ExcelFinalExportPipeline
+
+
+class AsyncDatabasePipeline:
+    """
+    Stores items in the SQLite database from coroutines. The connection lives in its own thread, as in aiosqlite,
+    but the whole transaction of an item runs there in one call. The crawler connection is still written
+    on the event loop by BlocketSpiderMiddleware and NearDuplicatePipeline, so a transaction that waits
+    for the event loop between its statements would hold the write lock until their busy timeout expires.
+    """
+
+    timeout = 30
+
+    def __init__(self, crawler: Crawler):
+        self.settings = crawler.settings
+        self.db_file = self.settings.get("SQLITE_FILE")
+        self.connection: sqlite3.Connection | None = None
+        self.id_cache: IdCache = getattr(crawler, "id_cache", None) or IdCache()
+        # One thread owns the connection, items are written one by one
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self.item_counter = 0
+        self.batch_size = 50
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def open_spider(self, spider):
+        return deferred_from_coro(self._open())
+
+    async def _open(self):
+        self.connection = await self._run(self._connect)
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_file, timeout=self.timeout, check_same_thread=False)
+        # In WAL mode reads of the crawler connection don't wait for this one,
+        # and commits with synchronous=NORMAL don't fsync, so item transactions stay short
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        return connection
+
+    async def process_item(self, item, spider):
+        if not await self._run(self._store_item, item):
+            spider.logger.info(f"Drop item {item['url']}. URL already exists in the database.")
+            raise DropItem()
+        self.item_counter += 1
+        if self.item_counter % self.batch_size == 0:
+            spider.logger.info(f"~~~Added {self.item_counter} jobs")
+        return item
+
+    def _store_item(self, item) -> bool:
+        """Inserts the job in one transaction. Returns False if the URL exists"""
+        cursor = self.connection.cursor()
+        try:
+            execute_statements(cursor, insert_job_statements(item, self.id_cache))
+            self.connection.commit()
+            self.id_cache.commit()
+            return True
+        except IntegrityError:
+            self.connection.rollback()
+            self.id_cache.rollback()
+            return False
+        finally:
+            cursor.close()
+
+    def close_spider(self, spider):
+        return deferred_from_coro(self._close())
+
+    async def _close(self):
+        if self.connection is not None:
+            await self._run(self.connection.close)
+        self.executor.shutdown(wait=False)
+
+
+class AsyncExcelSavePipeline(ExcelSavePipeline):
+    """Save the bunch of items to Excel file in a worker thread"""
+
+    def __init__(self):
+        super().__init__()
+        # Batches are written one by one, each of them starts below the previous one
+        self.lock = asyncio.Lock()
+
+    def open_spider(self, spider: scrapy.Spider):
+        self.excel_file = spider.settings.get("EXCEL_FILE_INCREMENTAL")
+        return deferred_from_coro(asyncio.to_thread(self._init_workbook))
+
+    async def process_item(self, item, spider):
+        self.items.append(item)
+        if len(self.items) >= self.batch_size:
+            await self._save_in_thread()
+        return item
+
+    async def _save_in_thread(self):
+        async with self.lock:
+            items, self.items = self.items, []
+            if items:
+                await asyncio.to_thread(self.write_items, items)
+
+    def close_spider(self, spider):
+        return deferred_from_coro(self._save_in_thread())
+
+
+class AsyncExcelFinalExportPipeline(ExcelFinalExportPipeline):
+    """
+    Save the all data to xlsx in a worker thread.
+    The thread uses its own connection because the crawler connection belongs to the reactor thread.
+    """
+
+    def close_spider(self, spider):
+        return deferred_from_coro(self._export_in_thread(spider))
+
+    async def _export_in_thread(self, spider):
+        db_file = spider.settings.get("SQLITE_FILE")
+        await asyncio.to_thread(self._export_with_new_connection, db_file, spider.logger)
+
+    def _export_with_new_connection(self, db_file: str, logger):
+        connection = sqlite3.connect(db_file, timeout=AsyncDatabasePipeline.timeout)
+        try:
+            self.export_with_log(connection, logger)
+        finally:
+            connection.close()
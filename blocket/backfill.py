@@ -0,0 +1,114 @@
+import logging
+import os
+import sqlite3
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+
+from blocket.db import NEXT_CHANGE_SEQ
+from blocket.pipelines import JobPipeline
+
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_NAME = "jobs_derived_columns"
+
+# Dates repeat across jobs and dateparser is the slowest part, every worker process keeps its own cache
+convert_date = lru_cache(maxsize=65536)(JobPipeline.convert_date)
+
+
+def recompute_rows(rows: list[tuple]) -> list[tuple]:
+    """
+    Recomputes published_date, apply_date and additional_contacts with JobPipeline for (id, published_date,
+    apply_date, description, additional_contacts) rows. Returns new values, id and old values of changed rows only.
+    Executed in worker processes, so it gets and returns only plain data.
+    """
+    updates = []
+    for id_, published_date, apply_date, description, additional_contacts in rows:
+        new_values = (
+            convert_date(published_date) if published_date else None,
+            convert_date(apply_date) if apply_date else None,
+            JobPipeline.extract_contacts(description) if description else None,
+        )
+        if new_values != (published_date, apply_date, additional_contacts):
+            updates.append((*new_values, id_, published_date, apply_date, additional_contacts))
+    return updates
+
+
+def _read_range(connection: sqlite3.Connection, first_id: int, last_id: int) -> list[tuple]:
+    return connection.execute('''
+    SELECT id, published_date, apply_date, description, additional_contacts FROM jobs
+    WHERE id BETWEEN ? AND ?
+    ''', (first_id, last_id)).fetchall()
+
+
+def _load_checkpoint(connection: sqlite3.Connection, restart: bool) -> tuple[int, int]:
+    """Returns the last committed id and the number of updated rows of an unfinished backfill"""
+    row = connection.execute("SELECT last_id, rows_updated, finished_date FROM backfill_state WHERE name = ?",
+                             (BACKFILL_NAME,)).fetchone()
+    if row is None or restart or row[2] is not None:
+        connection.execute('''
+        INSERT INTO backfill_state (name, last_id, rows_updated, started_date, finished_date)
+        VALUES (?, 0, 0, ?, NULL)
+        ON CONFLICT(name) DO UPDATE SET
+            last_id = 0, rows_updated = 0, started_date = excluded.started_date, finished_date = NULL
+        ''', (BACKFILL_NAME, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        connection.commit()
+        return 0, 0
+    return row[0], row[1]
+
+
+def backfill_jobs(connection: sqlite3.Connection, processes: int | None = None, batch_size: int = 1000,
+                  restart: bool = False) -> dict:
+    """
+    Recomputes the derived columns of the whole jobs table with a process pool.
+    The table is read in id ranges of batch_size, up to two ranges per process are computed at once.
+    Every range is written in its own short transaction together with the checkpoint, so an interrupted
+    backfill continues after the last committed range and a concurrent crawl waits for one small
+    transaction at most.
+    """
+    processes = processes or os.cpu_count()
+    last_id, rows_updated = _load_checkpoint(connection, restart)
+    if last_id:
+        logger.info(f"Resume backfill after id {last_id}")
+    # Jobs inserted by a concurrent crawl after this point already have values of the current JobPipeline
+    max_id = connection.execute("SELECT MAX(id) FROM jobs").fetchone()[0] or 0
+    result = {"rows_read": 0, "rows_updated": rows_updated, "resumed_after_id": last_id}
+    pending = deque()
+    next_id = last_id + 1
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        while pending or next_id <= max_id:
+            while next_id <= max_id and len(pending) < processes * 2:
+                range_end = min(next_id + batch_size - 1, max_id)
+                rows = _read_range(connection, next_id, range_end)
+                pending.append((range_end, len(rows), executor.submit(recompute_rows, rows)))
+                next_id = range_end + 1
+            # Ranges are committed in order, so the checkpoint never skips an uncommitted range
+            range_end, rows_count, future = pending.popleft()
+            updates = future.result()
+            cursor = connection.cursor()
+            try:
+                # Rows changed by a crawl or reparse since they were read keep the newer values
+                cursor.executemany(f'''
+                UPDATE jobs SET published_date = ?, apply_date = ?, additional_contacts = ?, change_seq = {NEXT_CHANGE_SEQ}
+                WHERE id = ? AND published_date IS ? AND apply_date IS ? AND additional_contacts IS ?
+                ''', updates)
+                updated = cursor.rowcount
+                cursor.execute('''
+                UPDATE backfill_state SET last_id = ?, rows_updated = rows_updated + ?
+                WHERE name = ?
+                ''', (range_end, updated, BACKFILL_NAME))
+                connection.commit()
+            except sqlite3.Error:
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
+            result["rows_read"] += rows_count
+            result["rows_updated"] += updated
+            logger.info(f"Backfilled jobs up to id {range_end} of {max_id}")
+    connection.execute("UPDATE backfill_state SET finished_date = ? WHERE name = ?",
+                       (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), BACKFILL_NAME))
+    connection.commit()
+    return result
@@ -0,0 +1,4 @@
+# Custom Scrapy commands of the project
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/commands.html#custom-project-commands
@@ -0,0 +1,43 @@
+import sqlite3
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from blocket.backfill import backfill_jobs
+from blocket.db import init_db
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def short_desc(self):
+        return "Recompute published_date, apply_date and additional_contacts of stored jobs"
+
+    def long_desc(self):
+        return ("Runs JobPipeline.convert_date and JobPipeline.extract_contacts over the whole jobs table "
+                "with a process pool. Progress is saved after every batch, an interrupted backfill continues "
+                "from the last batch. Can run during a crawl.")
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--processes", type=int, default=None,
+                            help="number of worker processes (default: number of CPUs)")
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="number of job ids read and written in one transaction")
+        parser.add_argument("--restart", action="store_true",
+                            help="start from the first job instead of the saved checkpoint")
+
+    def run(self, args, opts):
+        if opts.batch_size < 1:
+            raise UsageError("--batch-size must be positive")
+        # The crawl may hold the write lock for one item, wait for it instead of failing
+        connection = sqlite3.connect(self.settings.get("SQLITE_FILE"), timeout=30)
+        try:
+            init_db(connection)
+            result = backfill_jobs(connection, processes=opts.processes, batch_size=opts.batch_size,
+                                   restart=opts.restart)
+        finally:
+            connection.close()
+        for key, value in result.items():
+            print(f"{key}: {value}")
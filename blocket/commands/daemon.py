@@ -0,0 +1,38 @@
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from blocket.daemon import CrawlDaemon
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+
+    def short_desc(self):
+        return "Run the blocket spider on a schedule in one long-lived process"
+
+    def long_desc(self):
+        return ("Runs the blocket spider every DAEMON_INTERVAL seconds. The DB connection, the id cache of "
+                "lookup tables and the job parsing process pool are kept between runs. "
+                "The control endpoint on 127.0.0.1:DAEMON_CONTROL_PORT serves GET /stats, POST /run and POST /stop.")
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--interval", type=float, help="seconds between the end of a run and the next run "
+                                                           "(default: DAEMON_INTERVAL)")
+        parser.add_argument("--port", type=int, help="control endpoint port, 0 - disabled "
+                                                     "(default: DAEMON_CONTROL_PORT)")
+
+    def run(self, args, opts):
+        interval = opts.interval if opts.interval is not None else self.settings.getfloat("DAEMON_INTERVAL", 3600)
+        port = opts.port if opts.port is not None else self.settings.getint("DAEMON_CONTROL_PORT", 0)
+        if interval <= 0:
+            raise UsageError("--interval must be positive")
+        daemon = CrawlDaemon(self.crawler_process, interval)
+        try:
+            # The first crawler installs TWISTED_REACTOR, so the endpoint is started after it
+            daemon.start()
+            if port:
+                daemon.listen(port)
+            self.crawler_process.start(stop_after_crawl=False)
+        finally:
+            daemon.close()
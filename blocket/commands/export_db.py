@@ -0,0 +1,40 @@
+import logging
+import sqlite3
+
+from scrapy.commands import ScrapyCommand
+
+from blocket.db import init_db
+from blocket.pipelines import ExcelFinalExportPipeline
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def short_desc(self):
+        return "Export jobs from the database to EXCEL_FILE_FROM_DB"
+
+    def long_desc(self):
+        return ("Rebuilds EXCEL_FILE_FROM_DB with all jobs (--full) or saves jobs added or changed since "
+                "the previous export to a dated delta file (--delta). Default mode is EXCEL_EXPORT_MODE.")
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument("--full", dest="mode", action="store_const", const="full", help="export all jobs")
+        group.add_argument("--delta", dest="mode", action="store_const", const="delta",
+                           help="export only new and changed jobs")
+
+    def run(self, args, opts):
+        exporter = ExcelFinalExportPipeline()
+        exporter.excel_file = self.settings.get("EXCEL_FILE_FROM_DB")
+        exporter.mode = opts.mode or self.settings.get("EXCEL_EXPORT_MODE", "full")
+        logger = logging.getLogger(__name__)
+        logger.addHandler(logging.StreamHandler())
+        logger.setLevel(logging.INFO)
+        connection = sqlite3.connect(self.settings.get("SQLITE_FILE"))
+        try:
+            init_db(connection)
+            exporter.export_with_log(connection, logger)
+        finally:
+            connection.close()
@@ -0,0 +1,67 @@
+import json
+import sqlite3
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from blocket.db import init_db
+from blocket.loadgen import run_load_test
+from blocket.spiders.blocket import BlocketSpider
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def syntax(self):
+        return "[options] DB_FILE"
+
+    def short_desc(self):
+        return "Measure DB-backed components on a synthetic database of growing size"
+
+    def long_desc(self):
+        return ("Fills DB_FILE with synthetic visited_urls and jobs rows up to every scale step and runs "
+                "JobUrlDupeFilter, BlocketSpiderMiddleware and DatabasePipeline against synthetic requests "
+                "and items. Reports throughput, latency percentiles and database size. "
+                "DB_FILE must not be the production database.")
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--scales", default="100000,1000000,10000000",
+                            help="comma-separated numbers of visited_urls rows (default: %(default)s)")
+        parser.add_argument("--ops", type=int, default=5000,
+                            help="operations per component at every scale step (default: %(default)s)")
+        parser.add_argument("--seed", type=int, default=0, help="random seed (default: %(default)s)")
+        parser.add_argument("-o", "--output", metavar="FILE", help="also write results to FILE as JSON lines")
+
+    def run(self, args, opts):
+        if len(args) != 1:
+            raise UsageError()
+        db_file = args[0]
+        if db_file == self.settings.get("SQLITE_FILE"):
+            raise UsageError("DB_FILE must not be SQLITE_FILE")
+        try:
+            scales = [int(s) for s in opts.scales.split(",")]
+        except ValueError:
+            raise UsageError("--scales must be comma-separated integers")
+
+        connection = sqlite3.connect(db_file)
+        init_db(connection)
+        crawler = self.crawler_process.create_crawler(BlocketSpider)
+        crawler.db_connection = connection
+        spider = BlocketSpider.from_crawler(crawler)
+        output = open(opts.output, "a", encoding="utf-8") if opts.output else None
+        print(f"{'scale':>12} {'component':<12} {'ops/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'DB MB':>9}")
+        try:
+            for result in run_load_test(crawler, spider, db_file, scales, opts.ops, opts.seed):
+                for component in ("dupefilter", "middleware", "pipeline"):
+                    r = result[component]
+                    print(f"{result['scale']:>12} {component:<12} {r['ops_per_sec']:>9} {r['p50_ms']:>9} "
+                          f"{r['p95_ms']:>9} {r['p99_ms']:>9} {result['db_size_mb']:>9}")
+                if output:
+                    output.write(json.dumps(result) + "\n")
+                    output.flush()
+        finally:
+            if output:
+                output.close()
+            connection.close()
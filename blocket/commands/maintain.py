@@ -0,0 +1,33 @@
+import os
+import sqlite3
+
+from scrapy.commands import ScrapyCommand
+
+from blocket.db import init_db
+from blocket.maintenance import run_maintenance
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def short_desc(self):
+        return "Apply retention policies to the database and compact it"
+
+    def long_desc(self):
+        return ("Deletes old processed category pages from visited_urls, moves expired jobs to the archive "
+                "database and runs incremental vacuum and ANALYZE. Policies are set with RETENTION_* settings. "
+                "Don't run it during a crawl.")
+
+    def run(self, args, opts):
+        db_file = self.settings.get("SQLITE_FILE")
+        size_before = os.path.getsize(db_file) if os.path.exists(db_file) else 0
+        connection = sqlite3.connect(db_file)
+        try:
+            init_db(connection)
+            result = run_maintenance(connection, self.settings)
+        finally:
+            connection.close()
+        for key, value in result.items():
+            print(f"{key}: {value}")
+        print(f"Database size: {size_before} -> {os.path.getsize(db_file)} bytes")
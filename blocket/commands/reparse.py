@@ -0,0 +1,45 @@
+import sqlite3
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from blocket.db import init_db
+from blocket.reparse import reparse_archive
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def short_desc(self):
+        return "Parse archived job pages again and update the jobs table"
+
+    def long_desc(self):
+        return ("Runs job page parsing and JobPipeline over the pages saved by PageArchiveMiddleware "
+                "in PAGE_ARCHIVE_FILE with a process pool, without network requests. "
+                "Only jobs that are still in the jobs table are updated.")
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--processes", type=int, default=None,
+                            help="number of worker processes (default: number of CPUs)")
+        parser.add_argument("--batch-size", type=int, default=500,
+                            help="number of pages read from the archive and written to DB at once")
+
+    def run(self, args, opts):
+        if opts.batch_size < 1:
+            raise UsageError("--batch-size must be positive")
+        connection = sqlite3.connect(self.settings.get("SQLITE_FILE"))
+        try:
+            init_db(connection)
+            result = reparse_archive(
+                connection,
+                self.settings.get("PAGE_ARCHIVE_FILE"),
+                processes=opts.processes,
+                batch_size=opts.batch_size,
+                save_description=self.settings.getbool("SAVE_JOB_DESCRIPTION"),
+            )
+        finally:
+            connection.close()
+        for key, value in result.items():
+            print(f"{key}: {value}")
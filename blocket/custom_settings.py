@@ -4,6 +4,11 @@ SQLITE_FILE = "blocket.db"
 JOBDIR = "spider_data"
 EXCEL_FILE_INCREMENTAL = "job_data.xlsx"
 EXCEL_FILE_FROM_DB = "job_data_from_db.xlsx"
+# EXCEL_EXPORT_MODE - export of the database at the end of the run:
+# "full" — EXCEL_FILE_FROM_DB is rewritten with all jobs.
+# "delta" — only jobs added or processed again since the previous export are saved to
+# job_data_from_db_delta_<date>.xlsx. Run "scrapy export_db --full" to rebuild EXCEL_FILE_FROM_DB.
+EXCEL_EXPORT_MODE = "delta"
 
 SAVE_JOB_DESCRIPTION = True
 
@@ -19,20 +24,89 @@ MAX_CATEGORY_PAGE_NUMBER = 1
 
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 
+# NEAR_DUPLICATE_ENABLED - find reposted jobs by MinHash of title and description.
+# Jobs with estimated similarity >= NEAR_DUPLICATE_THRESHOLD get duplicate_of with the URL of the first job.
+# NEAR_DUPLICATE_ACTION: "flag" - save with duplicate_of, "drop" - don't save near-duplicates
+NEAR_DUPLICATE_ENABLED = False
+NEAR_DUPLICATE_THRESHOLD = 0.8
+NEAR_DUPLICATE_ACTION = "flag"
+
+# NDJSON_FEED_ENABLED - append items to rotating NDJSON segments in NDJSON_FEED_DIR for streaming consumers.
+# Buffered writes are fsynced after NDJSON_FEED_FSYNC_BYTES or NDJSON_FEED_FSYNC_SECONDS,
+# segments are rotated after NDJSON_FEED_ROTATE_BYTES or NDJSON_FEED_ROTATE_SECONDS and optionally gzipped
+NDJSON_FEED_ENABLED = False
+NDJSON_FEED_DIR = "feed"
+NDJSON_FEED_BUFFER_SIZE = 65536
+NDJSON_FEED_FSYNC_BYTES = 1048576
+NDJSON_FEED_FSYNC_SECONDS = 5
+NDJSON_FEED_ROTATE_BYTES = 67108864
+NDJSON_FEED_ROTATE_SECONDS = 3600
+NDJSON_FEED_COMPRESS = False
+
+# PAGE_ARCHIVE_ENABLED - save compressed raw pages of PAGE_ARCHIVE_PAGE_TYPES to PAGE_ARCHIVE_FILE.
+# Archived job pages can be parsed again without network with "scrapy reparse"
+PAGE_ARCHIVE_ENABLED = False
+PAGE_ARCHIVE_FILE = "blocket_pages.db"
+PAGE_ARCHIVE_PAGE_TYPES = ["job_page"]
+
+# Retention policies for the "scrapy maintain" command. None disables the policy.
+# RETENTION_CATEGORY_PAGE_DAYS - processed main and category pages older than N days are deleted from visited_urls
+RETENTION_CATEGORY_PAGE_DAYS = 30
+# RETENTION_JOB_PAGE_DAYS - processed job pages older than N days are deleted from visited_urls
+# and can be scraped again
+RETENTION_JOB_PAGE_DAYS = None
+# RETENTION_ARCHIVE_EXPIRED_JOBS - jobs with apply_date older than RETENTION_EXPIRED_JOB_DAYS days
+# are moved to ARCHIVE_SQLITE_FILE
+RETENTION_ARCHIVE_EXPIRED_JOBS = True
+RETENTION_EXPIRED_JOB_DAYS = 0
+ARCHIVE_SQLITE_FILE = "blocket_archive.db"
+# RETENTION_COMPACT - run incremental vacuum and ANALYZE after the retention policies
+RETENTION_COMPACT = True
+
+COMMANDS_MODULE = "blocket.commands"
+
+# Daemon mode ("scrapy daemon"): one process runs the spider every DAEMON_INTERVAL seconds and keeps
+# the DB connection, the id cache of lookup tables and the job parsing process pool between runs
+DAEMON_INTERVAL = 3600
+# DAEMON_CONTROL_PORT - port of the local control endpoint (GET /stats, POST /run, POST /stop), 0 - disabled
+DAEMON_CONTROL_PORT = 6080
+# DAEMON_SQLITE_CACHE_MB - page cache size of the long-lived DB connection
+DAEMON_SQLITE_CACHE_MB = 64
+
+# TRACING_ENABLED - save spans of TRACING_SAMPLE_RATE of requests (dupefilter, scheduler queue, download,
+# spider middleware, callback, pipelines) to TRACING_FILE in Chrome trace format (open in ui.perfetto.dev)
+TRACING_ENABLED = False
+TRACING_FILE = "trace.json"
+TRACING_SAMPLE_RATE = 0.1
+
 EXTENSIONS = {
     'blocket.extensions.LoggingExtension': 400,
     'blocket.extensions.DbExtension': 500,
+    'blocket.extensions.TracingExtension': 600,
 }
 ITEM_PIPELINES = {
    "blocket.pipelines.JobPipeline": 300,
+   "blocket.pipelines.NearDuplicatePipeline": 350,
    "blocket.pipelines.DatabasePipeline": 400,
    "blocket.pipelines.ExcelSavePipeline": 500,
+   "blocket.pipelines.NdjsonFeedPipeline": 550,
    "blocket.pipelines.ExcelFinalExportPipeline": 600,
 }
+# Asyncio pipelines (DB transactions and Excel writing in threads) don't block the reactor.
+# The spider middleware and NearDuplicatePipeline still write with the synchronous crawler connection,
+# AsyncDatabasePipeline switches the database to WAL so they wait for one item transaction at most:
+# ITEM_PIPELINES = {
+#    "blocket.pipelines.JobPipeline": 300,
+#    "blocket.pipelines.NearDuplicatePipeline": 350,
+#    "blocket.async_pipelines.AsyncDatabasePipeline": 400,
+#    "blocket.async_pipelines.AsyncExcelSavePipeline": 500,
+#    "blocket.async_pipelines.AsyncExcelFinalExportPipeline": 600,
+# }
 
 
 SPIDER_MIDDLEWARES = {
     'blocket.middlewares.BlocketSpiderMiddleware': 543,
+    'blocket.middlewares.PageArchiveMiddleware': 550,
 }
 
 
@@ -50,6 +124,10 @@ AUTOTHROTTLE_START_DELAY = 1
 AUTOTHROTTLE_MAX_DELAY = 60
 AUTOTHROTTLE_TARGET_CONCURRENCY = 8.0
 REACTOR_THREADPOOL_MAXSIZE = 20
+# JOB_PARSE_PROCESSES - number of worker processes for parsing job pages, 0 - parse in the reactor thread
+JOB_PARSE_PROCESSES = 0
+# JOB_PARSE_MAX_PENDING - maximum number of job pages sent to worker processes at once (0 - JOB_PARSE_PROCESSES * 4)
+JOB_PARSE_MAX_PENDING = 0
 
 
 #REQUEST_FINGERPRINTER_IMPLEMENTATION = "2.7"
@@ -0,0 +1,177 @@
+import json
+import logging
+import sqlite3
+import time
+from datetime import datetime
+
+from scrapy.crawler import Crawler, CrawlerRunner
+from scrapy.settings import Settings
+from twisted.internet import defer
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+
+from blocket.db import IdCache, init_db
+from blocket.spiders.blocket import BlocketSpider, create_parse_executor
+
+
+logger = logging.getLogger(__name__)
+# twisted.internet.reactor is imported inside functions, importing it here would install the default reactor
+# before Scrapy installs TWISTED_REACTOR
+
+
+class WarmState:
+    """
+    Objects that outlive a single crawl in daemon mode: the DB connection with its page cache,
+    ids of companies, locations, categories and job types, and the job parsing process pool.
+    They are set on every new crawler before it starts.
+    """
+
+    def __init__(self, settings: Settings):
+        self.connection = sqlite3.connect(settings.get("SQLITE_FILE"), check_same_thread=False)
+        init_db(self.connection)
+        cache_mb = settings.getint("DAEMON_SQLITE_CACHE_MB", 64)
+        # Negative cache_size is in KiB
+        self.connection.execute(f"PRAGMA cache_size = {-cache_mb * 1024}")
+        self.id_cache = IdCache()
+        self.parse_executor = create_parse_executor(settings.getint("JOB_PARSE_PROCESSES", 0))
+
+    def attach(self, crawler: Crawler):
+        crawler.db_connection = self.connection
+        crawler.id_cache = self.id_cache
+        crawler.parse_executor = self.parse_executor
+
+    def close(self):
+        if self.parse_executor:
+            self.parse_executor.shutdown(wait=False, cancel_futures=True)
+        self.connection.close()
+
+
+class CrawlDaemon:
+    """
+    Runs the spider every interval seconds in one long-lived process.
+    A run can be started earlier from the control endpoint, runs never overlap.
+    """
+
+    def __init__(self, runner: CrawlerRunner, interval: float, spidercls=BlocketSpider):
+        self.runner = runner
+        self.interval = interval
+        self.spidercls = spidercls
+        self.state = WarmState(runner.settings)
+        self.running = False
+        self.stopping = False
+        self.cycles = 0
+        self.started_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.next_run_at: float | None = None
+        self.last_run: dict = {}
+        self._wakeup: defer.Deferred | None = None
+
+    def start(self) -> defer.Deferred:
+        return defer.ensureDeferred(self._loop())
+
+    async def _loop(self):
+        while not self.stopping:
+            await self.run_cycle()
+            if self.stopping:
+                break
+            self.next_run_at = time.time() + self.interval
+            self._wakeup = defer.Deferred()
+            from twisted.internet import reactor
+            timer = reactor.callLater(self.interval, self.wake)
+            await self._wakeup
+            if timer.active():
+                timer.cancel()
+            self.next_run_at = None
+
+    async def run_cycle(self):
+        crawler = self.runner.create_crawler(self.spidercls)
+        self.state.attach(crawler)
+        self.running = True
+        start = time.perf_counter()
+        started_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        logger.info(f"Start crawl cycle {self.cycles + 1}")
+        error = None
+        try:
+            await self.runner.crawl(crawler)
+        except Exception as e:
+            error = repr(e)
+            logger.error(f"Crawl cycle {self.cycles + 1} failed: {e}")
+        finally:
+            self.running = False
+        self.cycles += 1
+        self.last_run = {
+            "started_date": started_date,
+            "duration_seconds": round(time.perf_counter() - start, 1),
+            "error": error,
+            "stats": crawler.stats.get_stats() if crawler.stats else {},
+        }
+        logger.info(f"Crawl cycle {self.cycles} finished in {self.last_run['duration_seconds']} s")
+
+    def wake(self):
+        if self._wakeup is not None and not self._wakeup.called:
+            self._wakeup.callback(None)
+
+    def trigger(self) -> bool:
+        """Starts a run now. Returns False if a run is in progress"""
+        if self.running:
+            return False
+        self.wake()
+        return True
+
+    def stop(self) -> defer.Deferred:
+        """Stops the running crawl and the schedule"""
+        self.stopping = True
+        self.wake()
+        return self.runner.stop()
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "cycles": self.cycles,
+            "started_date": self.started_date,
+            "interval_seconds": self.interval,
+            "next_run_in_seconds": round(self.next_run_at - time.time(), 1) if self.next_run_at else None,
+            "id_cache_size": {table: len(ids) for table, ids in self.state.id_cache.ids.items()},
+            "last_run": self.last_run,
+        }
+
+    def listen(self, port: int):
+        """Serves the control endpoint on localhost only"""
+        from twisted.internet import reactor
+        return reactor.listenTCP(port, Site(ControlResource(self)), interface="127.0.0.1")
+
+    def close(self):
+        self.state.close()
+
+
+class ControlResource(Resource):
+    """
+    GET /stats - daemon state and stats of the last run
+    POST /run - start a run now
+    POST /stop - stop the daemon
+    """
+    isLeaf = True
+
+    def __init__(self, daemon: CrawlDaemon):
+        super().__init__()
+        self.daemon = daemon
+
+    def _json(self, request, code: int, data: dict) -> bytes:
+        request.setResponseCode(code)
+        request.setHeader(b"Content-Type", b"application/json")
+        return json.dumps(data, default=str, indent=2).encode("utf-8")
+
+    def render_GET(self, request):
+        if request.path == b"/stats":
+            return self._json(request, 200, self.daemon.stats())
+        return self._json(request, 404, {"error": "not found"})
+
+    def render_POST(self, request):
+        if request.path == b"/run":
+            if self.daemon.trigger():
+                return self._json(request, 202, {"started": True})
+            return self._json(request, 409, {"started": False, "error": "a run is in progress"})
+        if request.path == b"/stop":
+            from twisted.internet import reactor
+            self.daemon.stop().addBoth(lambda _: reactor.stop())
+            return self._json(request, 202, {"stopping": True})
+        return self._json(request, 404, {"error": "not found"})
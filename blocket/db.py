@@ -0,0 +1,455 @@
+import sqlite3
+
+
+SCHEMA = '''
+    PRAGMA auto_vacuum = INCREMENTAL;
+    CREATE TABLE IF NOT EXISTS companies (
+        id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS locations (
+        id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS categories (
+        id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS job_types (
+        id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY,
+        url TEXT UNIQUE,
+        title TEXT,
+        company_id INTEGER REFERENCES companies(id),
+        published_date TEXT,
+        apply_date TEXT,
+        location_id INTEGER REFERENCES locations(id),
+        job_type_id INTEGER REFERENCES job_types(id),
+        description TEXT,
+        processed_date TEXT,
+        phone TEXT,
+        email TEXT,
+        additional_contacts TEXT,
+        -- Set to the next value of MAX(change_seq) when stored values are recomputed (backfill, reparse),
+        -- so delta exports include the job again. It grows with every commit, unlike a date with one-second resolution
+        change_seq INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_change_seq ON jobs(change_seq);
+    CREATE INDEX IF NOT EXISTS idx_jobs_company_id ON jobs(company_id);
+    CREATE INDEX IF NOT EXISTS idx_jobs_location_id ON jobs(location_id);
+    CREATE TABLE IF NOT EXISTS job_categories (
+        job_id INTEGER REFERENCES jobs(id),
+        category_id INTEGER REFERENCES categories(id),
+        position INTEGER,
+        PRIMARY KEY (job_id, category_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_job_categories_category_id ON job_categories(category_id);
+    -- Jobs in the shape they had before normalization, category is comma-joined as JobPipeline does
+    CREATE VIEW IF NOT EXISTS jobs_view AS
+    SELECT
+        j.id, j.url, j.title, co.name AS company, j.published_date, j.apply_date, l.name AS location,
+        (
+            SELECT group_concat(name, ', ') FROM (
+                SELECT c.name FROM job_categories jc JOIN categories c ON c.id = jc.category_id
+                WHERE jc.job_id = j.id
+                ORDER BY jc.position
+            )
+        ) AS category,
+        t.name AS job_type, j.description, j.processed_date, j.phone, j.email, j.additional_contacts
+    FROM jobs j
+    LEFT JOIN companies co ON co.id = j.company_id
+    LEFT JOIN locations l ON l.id = j.location_id
+    LEFT JOIN job_types t ON t.id = j.job_type_id;
+    CREATE TABLE IF NOT EXISTS visited_urls (
+        fingerprint BLOB PRIMARY KEY,
+        url TEXT,
+        parent_url TEXT,
+        page_type TEXT,
+        status TEXT,
+        last_processed_date TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_processed_date ON jobs(processed_date);
+    CREATE TABLE IF NOT EXISTS export_state (
+        name TEXT PRIMARY KEY,
+        last_id INTEGER,
+        last_processed_date TEXT,
+        exported_date TEXT,
+        last_change_seq INTEGER NOT NULL DEFAULT 0
+    );
+    -- Checkpoints of "scrapy backfill", last_id is the last jobs id committed
+    CREATE TABLE IF NOT EXISTS backfill_state (
+        name TEXT PRIMARY KEY,
+        last_id INTEGER,
+        rows_updated INTEGER,
+        started_date TEXT,
+        finished_date TEXT
+    );
+    CREATE TABLE IF NOT EXISTS company_stats (
+        company_id INTEGER PRIMARY KEY REFERENCES companies(id),
+        jobs_count INTEGER NOT NULL DEFAULT 0,
+        first_seen_date TEXT,
+        last_seen_date TEXT
+    );
+    CREATE TABLE IF NOT EXISTS company_category_stats (
+        company_id INTEGER REFERENCES companies(id),
+        category_id INTEGER REFERENCES categories(id),
+        jobs_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (company_id, category_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS company_location_stats (
+        company_id INTEGER REFERENCES companies(id),
+        location_id INTEGER REFERENCES locations(id),
+        jobs_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (company_id, location_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS job_minhash (
+        url TEXT PRIMARY KEY,
+        signature BLOB,
+        duplicate_of TEXT
+    );
+    CREATE TABLE IF NOT EXISTS job_lsh_buckets (
+        band INTEGER,
+        bucket BLOB,
+        url TEXT,
+        PRIMARY KEY (band, bucket, url)
+    ) WITHOUT ROWID;
+    -- Last jobs id indexed by NearDuplicatePipeline.build_index, the next build starts after it
+    CREATE TABLE IF NOT EXISTS near_duplicate_state (
+        name TEXT PRIMARY KEY,
+        last_id INTEGER NOT NULL,
+        indexed_date TEXT
+    );
+'''
+
+PAGE_ARCHIVE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS page_archive (
+        fingerprint BLOB PRIMARY KEY,
+        url TEXT,
+        page_type TEXT,
+        meta TEXT,
+        encoding TEXT,
+        body BLOB,
+        archived_date TEXT
+    );
+'''
+
+JOB_INSERT = '''
+    INSERT INTO jobs (
+    url, title, company_id, published_date, apply_date, location_id, job_type_id, description,
+    processed_date, phone, email, additional_contacts
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Evaluated inside the write transaction, so a change committed after a delta export always gets a greater value
+NEXT_CHANGE_SEQ = "(SELECT IFNULL(MAX(change_seq), 0) + 1 FROM jobs)"
+
+# Replaces the parsed fields of a stored job, processed_date stays the date of the first processing
+JOB_UPDATE = f'''
+    UPDATE jobs SET
+        title = ?, company_id = ?, published_date = ?, apply_date = ?, location_id = ?, job_type_id = ?,
+        description = ?, phone = ?, email = ?, additional_contacts = ?, change_seq = {NEXT_CHANGE_SEQ}
+    WHERE id = ?
+'''
+
+JOB_CATEGORY_INSERT = "INSERT OR IGNORE INTO job_categories (job_id, category_id, position) VALUES (?, ?, ?)"
+
+# Moves jobs from the table with free text columns (renamed to jobs_denormalized) to the normalized tables
+MIGRATE_DENORMALIZED_JOBS = '''
+    INSERT OR IGNORE INTO companies (name)
+    SELECT DISTINCT company FROM jobs_denormalized WHERE company IS NOT NULL AND company != '';
+    INSERT OR IGNORE INTO locations (name)
+    SELECT DISTINCT location FROM jobs_denormalized WHERE location IS NOT NULL AND location != '';
+    INSERT OR IGNORE INTO job_types (name)
+    SELECT DISTINCT job_type FROM jobs_denormalized WHERE job_type IS NOT NULL AND job_type != '';
+    INSERT INTO jobs (
+        id, url, title, company_id, published_date, apply_date, location_id, job_type_id, description,
+        processed_date, phone, email, additional_contacts
+    )
+    SELECT
+        o.id, o.url, o.title, co.id, o.published_date, o.apply_date, l.id, t.id, o.description,
+        o.processed_date, o.phone, o.email, o.additional_contacts
+    FROM jobs_denormalized o
+    LEFT JOIN companies co ON co.name = o.company
+    LEFT JOIN locations l ON l.name = o.location
+    LEFT JOIN job_types t ON t.name = o.job_type;
+    CREATE TEMP TABLE split_categories AS
+    WITH RECURSIVE split(job_id, position, name, rest) AS (
+        SELECT id, -1, NULL, category || ',' FROM jobs_denormalized WHERE category IS NOT NULL AND category != ''
+        UNION ALL
+        SELECT job_id, position + 1, trim(substr(rest, 1, instr(rest, ',') - 1)), substr(rest, instr(rest, ',') + 1)
+        FROM split WHERE rest != ''
+    )
+    SELECT job_id, position, name FROM split WHERE name IS NOT NULL AND name != '';
+    INSERT OR IGNORE INTO categories (name) SELECT DISTINCT name FROM split_categories;
+    INSERT OR IGNORE INTO job_categories (job_id, category_id, position)
+    SELECT s.job_id, c.id, s.position FROM split_categories s JOIN categories c ON c.name = s.name;
+    DROP TABLE split_categories;
+    DROP TABLE jobs_denormalized;
+'''
+
+COMPANY_STATS_UPSERT = '''
+    INSERT INTO company_stats (company_id, jobs_count, first_seen_date, last_seen_date)
+    VALUES (?, 1, ?, ?)
+    ON CONFLICT(company_id) DO UPDATE SET
+        jobs_count = jobs_count + 1,
+        first_seen_date = MIN(first_seen_date, excluded.first_seen_date),
+        last_seen_date = MAX(last_seen_date, excluded.last_seen_date)
+'''
+
+COMPANY_CATEGORY_STATS_UPSERT = '''
+    INSERT INTO company_category_stats (company_id, category_id, jobs_count) VALUES (?, ?, 1)
+    ON CONFLICT(company_id, category_id) DO UPDATE SET jobs_count = jobs_count + 1
+'''
+
+COMPANY_LOCATION_STATS_UPSERT = '''
+    INSERT INTO company_location_stats (company_id, location_id, jobs_count) VALUES (?, ?, 1)
+    ON CONFLICT(company_id, location_id) DO UPDATE SET jobs_count = jobs_count + 1
+'''
+
+
+def init_db(connection: sqlite3.Connection):
+    """
+    Creates all tables if they do not exist and migrates jobs with free text columns to the normalized tables.
+    Company statistics are rebuilt once for databases created before the statistics tables existed
+    or with statistics keyed by company names.
+    """
+    cursor = connection.cursor()
+    try:
+        if "company" in [row[1] for row in cursor.execute("PRAGMA table_info(company_stats)")]:
+            cursor.executescript('''
+                DROP TABLE company_stats;
+                DROP TABLE company_category_stats;
+                DROP TABLE company_location_stats;
+            ''')
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(jobs)")]
+        if "company" in columns:
+            _migrate_denormalized_jobs(connection)
+        elif columns and "change_seq" not in columns:
+            cursor.execute("ALTER TABLE jobs ADD COLUMN change_seq INTEGER")
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(export_state)")]
+        if columns and "last_change_seq" not in columns:
+            cursor.execute("ALTER TABLE export_state ADD COLUMN last_change_seq INTEGER NOT NULL DEFAULT 0")
+        cursor.executescript(SCHEMA)
+        connection.commit()
+        cursor.execute("SELECT EXISTS(SELECT 1 FROM jobs), EXISTS(SELECT 1 FROM company_stats)")
+        has_jobs, has_stats = cursor.fetchone()
+    finally:
+        cursor.close()
+    if has_jobs and not has_stats:
+        rebuild_company_stats(connection)
+
+
+def _migrate_denormalized_jobs(connection: sqlite3.Connection):
+    """Replaces the jobs table with company, location, category and job_type text by the normalized tables"""
+    try:
+        connection.executescript(f'''
+            BEGIN;
+            DROP INDEX IF EXISTS idx_jobs_processed_date;
+            DROP INDEX IF EXISTS idx_published_date;
+            ALTER TABLE jobs RENAME TO jobs_denormalized;
+            {SCHEMA.replace("PRAGMA auto_vacuum = INCREMENTAL;", "")}
+            {MIGRATE_DENORMALIZED_JOBS}
+            COMMIT;
+        ''')
+    except sqlite3.Error:
+        connection.rollback()
+        raise
+
+
+class IdCache:
+    """
+    In-process cache of ids of companies, locations, categories and job types.
+    Ids of rows inserted in the current transaction are forgotten on rollback.
+    """
+    tables = ("companies", "locations", "categories", "job_types")
+
+    def __init__(self):
+        self.ids = {table: {} for table in self.tables}
+        self.pending = []
+
+    def lookup(self, table: str, name: str) -> int | None:
+        return self.ids[table].get(name)
+
+    def add(self, table: str, name: str, id_: int, inserted: bool = False):
+        self.ids[table][name] = id_
+        if inserted:
+            self.pending.append((table, name))
+
+    def id_statements(self, table: str, name: str | None):
+        """Statements that resolve the id of the name, the row is inserted if it does not exist. Returns the id"""
+        if not name:
+            return None
+        id_ = self.lookup(table, name)
+        if id_ is None:
+            rowcount, _, _ = yield f"INSERT INTO {table} (name) VALUES (?) ON CONFLICT(name) DO NOTHING", (name,)
+            _, _, row = yield f"SELECT id FROM {table} WHERE name = ?", (name,)
+            id_ = row[0]
+            self.add(table, name, id_, inserted=rowcount == 1)
+        return id_
+
+    def get_id(self, cursor: sqlite3.Cursor, table: str, name: str | None) -> int | None:
+        """Returns the id of the name, the row is inserted if it does not exist"""
+        return execute_statements(cursor, self.id_statements(table, name))
+
+    def commit(self):
+        self.pending.clear()
+
+    def rollback(self):
+        for table, name in self.pending:
+            self.ids[table].pop(name, None)
+        self.pending.clear()
+
+
+def open_page_archive(path: str) -> sqlite3.Connection:
+    """Opens the database with raw pages and creates the table if it does not exist"""
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.executescript(PAGE_ARCHIVE_SCHEMA)
+    return connection
+
+
+def execute_statements(cursor: sqlite3.Cursor, statements):
+    """
+    Executes a generator of (query, params) from the *_statements functions and returns its result.
+    (rowcount, lastrowid, first row of SELECT) of every statement is sent back to the generator.
+    Generators keep the SQL of a write in one place for the callers that share it.
+    """
+    result = None
+    while True:
+        try:
+            query, params = statements.send(result)
+        except StopIteration as stop:
+            return stop.value
+        cursor.execute(query, params)
+        result = (cursor.rowcount, cursor.lastrowid, cursor.fetchone() if returns_rows(query) else None)
+
+
+def returns_rows(query: str) -> bool:
+    return query.lstrip().upper().startswith("SELECT")
+
+
+def job_ids_statements(item, id_cache: IdCache):
+    """Statements that resolve ids of the company, location, job type and categories of the item"""
+    ids = {
+        "company_id": (yield from id_cache.id_statements("companies", item.get('company'))),
+        "location_id": (yield from id_cache.id_statements("locations", item.get('location'))),
+        "job_type_id": (yield from id_cache.id_statements("job_types", item.get('job_type'))),
+        "category_ids": [],
+    }
+    for name in split_categories(item.get('category')):
+        ids["category_ids"].append((yield from id_cache.id_statements("categories", name)))
+    return ids
+
+
+def job_params(item, ids: dict) -> tuple:
+    """Returns the parameters of JOB_INSERT for the item and ids from job_ids"""
+    return (
+        item.get('url'), item.get('title'), ids["company_id"], item.get('published_date'), item.get('apply_date'),
+        ids["location_id"], ids["job_type_id"], item.get('description'), item.get('processed_date'),
+        item.get('phone'), item.get('email'), item.get('additional_contacts')
+    )
+
+
+def job_category_params(job_id: int, category_ids: list[int]) -> list[tuple]:
+    return [(job_id, category_id, position) for position, category_id in enumerate(category_ids)]
+
+
+def insert_job_statements(item, id_cache: IdCache):
+    """Statements that insert the job with its categories and update company statistics"""
+    ids = yield from job_ids_statements(item, id_cache)
+    _, job_id, _ = yield JOB_INSERT, job_params(item, ids)
+    for params in job_category_params(job_id, ids["category_ids"]):
+        yield JOB_CATEGORY_INSERT, params
+    for statement in company_stats_statements(item, ids):
+        yield statement
+
+
+def insert_job(cursor: sqlite3.Cursor, item, id_cache: IdCache):
+    """
+    Inserts the job with its categories and updates company statistics.
+    Raises sqlite3.IntegrityError if the URL exists. The caller is responsible for commit
+    """
+    execute_statements(cursor, insert_job_statements(item, id_cache))
+
+
+def update_job(cursor: sqlite3.Cursor, item, id_cache: IdCache) -> bool:
+    """
+    Replaces fields and categories of the stored job with the URL of the item. Company statistics are not updated.
+    Returns False if the job is not in the jobs table (never stored or moved to the archive database)
+    """
+    row = cursor.execute("SELECT id FROM jobs WHERE url = ?", (item.get('url'),)).fetchone()
+    if row is None:
+        return False
+    job_id = row[0]
+    ids = execute_statements(cursor, job_ids_statements(item, id_cache))
+    cursor.execute(JOB_UPDATE, (
+        item.get('title'), ids["company_id"], item.get('published_date'), item.get('apply_date'), ids["location_id"],
+        ids["job_type_id"], item.get('description'), item.get('phone'), item.get('email'),
+        item.get('additional_contacts'), job_id
+    ))
+    cursor.execute("DELETE FROM job_categories WHERE job_id = ?", (job_id,))
+    cursor.executemany(JOB_CATEGORY_INSERT, job_category_params(job_id, ids["category_ids"]))
+    return True
+
+
+def split_categories(category: str | None) -> list[str]:
+    """Splits the category string joined by JobPipeline"""
+    return [c.strip() for c in category.split(',') if c.strip()] if category else []
+
+
+def company_stats_statements(item, ids: dict) -> list[tuple[str, tuple]]:
+    """
+    Returns the statements that account a newly inserted job in the company statistics tables.
+    Must be executed in the same transaction as the INSERT into jobs.
+    """
+    company_id = ids["company_id"]
+    if company_id is None:
+        return []
+    processed_date = item.get('processed_date')
+    statements = [(COMPANY_STATS_UPSERT, (company_id, processed_date, processed_date))]
+    # A category repeated in one job is stored once in job_categories
+    for category_id in dict.fromkeys(ids["category_ids"]):
+        statements.append((COMPANY_CATEGORY_STATS_UPSERT, (company_id, category_id)))
+    if ids["location_id"] is not None:
+        statements.append((COMPANY_LOCATION_STATS_UPSERT, (company_id, ids["location_id"])))
+    return statements
+
+
+def rebuild_company_stats(connection: sqlite3.Connection):
+    """
+    Recalculates company statistics from the whole jobs table.
+    Used for existing databases and after bulk changes of the jobs table.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("DELETE FROM company_stats")
+        cursor.execute("DELETE FROM company_category_stats")
+        cursor.execute("DELETE FROM company_location_stats")
+        cursor.execute('''
+        INSERT INTO company_stats (company_id, jobs_count, first_seen_date, last_seen_date)
+        SELECT company_id, COUNT(*), MIN(processed_date), MAX(processed_date)
+        FROM jobs WHERE company_id IS NOT NULL
+        GROUP BY company_id
+        ''')
+        cursor.execute('''
+        INSERT INTO company_location_stats (company_id, location_id, jobs_count)
+        SELECT company_id, location_id, COUNT(*)
+        FROM jobs WHERE company_id IS NOT NULL AND location_id IS NOT NULL
+        GROUP BY company_id, location_id
+        ''')
+        cursor.execute('''
+        INSERT INTO company_category_stats (company_id, category_id, jobs_count)
+        SELECT j.company_id, jc.category_id, COUNT(*)
+        FROM job_categories jc JOIN jobs j ON j.id = jc.job_id
+        WHERE j.company_id IS NOT NULL
+        GROUP BY j.company_id, jc.category_id
+        ''')
+        connection.commit()
+    except sqlite3.Error:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
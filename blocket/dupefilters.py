@@ -3,14 +3,19 @@ import sqlite3
 import logging
 import scrapy
 from scrapy.dupefilters import RFPDupeFilter
-from scrapy.utils.request import fingerprint
+
+from blocket.extensions import trace_span
+from blocket.fingerprints import FingerprintService, get_fingerprint_service
 
 
 class JobUrlDupeFilter(RFPDupeFilter):
-    def __init__(self, path=None, debug=False, *, fingerprinter=None, db_connection=None):
+    def __init__(self, path=None, debug=False, *, fingerprinter=None, db_connection=None, tracer=None,
+                 fingerprints: FingerprintService = None):
         super().__init__(path=path, debug=debug, fingerprinter=fingerprinter)
+        self.fingerprints = fingerprints or FingerprintService(self.fingerprinter)
         self.connection = db_connection
         self.cursor = self.connection.cursor()
+        self.tracer = tracer
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -18,7 +23,9 @@ class JobUrlDupeFilter(RFPDupeFilter):
         path = crawler.settings.get('JOB_URL_DUPEFILTER_PATH', None)
         debug = crawler.settings.getbool('DUPEFILTER_DEBUG', False)
         fingerprinter = crawler.request_fingerprinter
-        return cls(path=path, debug=debug, fingerprinter=fingerprinter, db_connection=db_connection)
+        tracer = getattr(crawler, 'tracer', None)
+        return cls(path=path, debug=debug, fingerprinter=fingerprinter, db_connection=db_connection, tracer=tracer,
+                   fingerprints=get_fingerprint_service(crawler))
 
     def request_seen(self, request: scrapy.Request):
         """
@@ -26,9 +33,11 @@ class JobUrlDupeFilter(RFPDupeFilter):
         For  request to main page and some category pages in update mode
         this filter will be disabled with dont_filter = true
         """
-        fp = fingerprint(request)
-        self.cursor.execute("SELECT 1 FROM visited_urls WHERE fingerprint = ?", (fp,))
-        return bool(self.cursor.fetchone())
+        fp = self.fingerprints.fingerprint(request)
+        with trace_span(self.tracer, "dupefilter.request_seen", fp, request.url,
+                        page_type=request.meta.get('page_type')):
+            self.cursor.execute("SELECT 1 FROM visited_urls WHERE fingerprint = ?", (fp,))
+            return bool(self.cursor.fetchone())
 
     def close_spider(self, spider):
         self.cursor.close()
\ No newline at end of file
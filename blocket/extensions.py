@@ -1,9 +1,20 @@
+import json
 import logging
 import logging.config
+import os
 import sqlite3
+import time
+from contextlib import contextmanager, nullcontext
+from scrapy import signals
 from scrapy.crawler import Crawler
 from scrapy.exceptions import NotConfigured
+from twisted.internet.defer import maybeDeferred
 
+from blocket.db import IdCache, init_db
+from blocket.fingerprints import get_fingerprint_service
+
+
+logger = logging.getLogger(__name__)
 
 class LoggingExtension:
     def __init__(self, crawler):
@@ -38,43 +49,19 @@ class DbExtension:
     def __init__(self, crawler: Crawler):
         bot_name = crawler.settings.get('BOT_NAME', 'scrapy_project')
         self.logger = logging.getLogger(bot_name)
+        if getattr(crawler, "db_connection", None) is not None:
+            # Daemon mode: the connection and the id cache are opened once and set on every crawler in advance
+            self.connection = crawler.db_connection
+            return
         self.connection: sqlite3.Connection = sqlite3.connect(crawler.settings.get("SQLITE_FILE"),
                                                               check_same_thread=False)
         crawler.db_connection = self.connection
-        cursor: sqlite3.Cursor = self.connection.cursor()
+        # Ids of companies, locations, categories and job types shared by the components writing jobs
+        crawler.id_cache = IdCache()
         try:
-            cursor.executescript('''
-                CREATE TABLE IF NOT EXISTS jobs (
-                    id INTEGER PRIMARY KEY,
-                    url TEXT UNIQUE,
-                    title TEXT,
-                    company TEXT,
-                    published_date TEXT, 
-                    apply_date TEXT, 
-                    location TEXT, 
-                    category TEXT, 
-                    job_type TEXT, 
-                    description TEXT,
-                    processed_date TEXT, 
-                    phone TEXT, 
-                    email TEXT, 
-                    additional_contacts TEXT
-                );
-                CREATE TABLE IF NOT EXISTS visited_urls (
-                    fingerprint BLOB PRIMARY KEY,
-                    url TEXT,
-                    parent_url TEXT,
-                    page_type TEXT,
-                    status TEXT,
-                    last_processed_date TEXT                   
-                );
-            ''')
-
-            self.connection.commit()
+            init_db(self.connection)
         except sqlite3.Error as e:
             self.logger.critical(f"Error creating database {e}")
-        finally:
-            cursor.close()
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -82,3 +69,205 @@ class DbExtension:
 
     def close_spider(self, spider):
         self.connection.close()
+
+
+class Tracer:
+    """
+    Collects spans of the request lifecycle in Chrome trace event format.
+    Every sampled request gets its own track (tid). Sampling depends only on the fingerprint,
+    so all components make the same decision for a request without sharing state.
+    """
+
+    def __init__(self, sample_rate: float, max_events: int):
+        self.sample_border = int(sample_rate * 2 ** 32)
+        self.max_events = max_events
+        self.origin = time.perf_counter()
+        self.events = []
+        self.dropped_events = 0
+        self.lanes = {}  # fingerprint -> tid
+        self.open_spans = {}  # (name, fingerprint) -> start
+        self.item_fingerprints = {}  # job url -> fingerprint of the job page
+
+    def sampled(self, fp: bytes | None) -> bool:
+        return fp is not None and int.from_bytes(fp[:4], 'big') < self.sample_border
+
+    def _lane(self, fp: bytes, url: str | None) -> int:
+        tid = self.lanes.get(fp)
+        if tid is None:
+            tid = self.lanes[fp] = len(self.lanes) + 1
+            self._append({"ph": "M", "name": "thread_name", "pid": 1, "tid": tid,
+                          "args": {"name": url or fp.hex()}})
+        return tid
+
+    def _append(self, event: dict):
+        if len(self.events) < self.max_events:
+            self.events.append(event)
+        else:
+            self.dropped_events += 1
+
+    def add_span(self, name: str, fp: bytes, start: float, duration: float, url: str = None, **args):
+        """Adds a complete event. start is a time.perf_counter() value, duration is in seconds"""
+        if not self.sampled(fp):
+            return
+        args["fingerprint"] = fp.hex()
+        if url:
+            args["url"] = url
+        self._append({
+            "name": name, "cat": name.split(".")[0], "ph": "X", "pid": 1, "tid": self._lane(fp, url),
+            "ts": round((start - self.origin) * 1e6, 1), "dur": round(duration * 1e6, 1), "args": args,
+        })
+
+    @contextmanager
+    def span(self, name: str, fp: bytes, url: str = None, **args):
+        if not self.sampled(fp):
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, fp, start, time.perf_counter() - start, url, **args)
+
+    def begin(self, name: str, fp: bytes):
+        """Opens a span that ends in another callback, e.g. between two signals"""
+        if self.sampled(fp):
+            self.open_spans[(name, fp)] = time.perf_counter()
+
+    def end(self, name: str, fp: bytes, url: str = None, **args):
+        start = self.open_spans.pop((name, fp), None)
+        if start is not None:
+            self.add_span(name, fp, start, time.perf_counter() - start, url, **args)
+
+    def timed_iter(self, iterable, name: str, fp: bytes, url: str = None, **args):
+        """
+        Yields from iterable and adds one span with the time spent inside it.
+        Used for spider callbacks, which run lazily while the middleware iterates their output.
+        """
+        if not self.sampled(fp):
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        first_start, busy = None, 0.0
+        while True:
+            start = time.perf_counter()
+            first_start = first_start or start
+            try:
+                value = next(iterator)
+            except StopIteration:
+                busy += time.perf_counter() - start
+                break
+            busy += time.perf_counter() - start
+            yield value
+        self.add_span(name, fp, first_start, busy, url, **args)
+
+    def link_item(self, item, fp: bytes):
+        """Remembers the job page of the item so pipeline spans go to the track of the page"""
+        if self.sampled(fp) and item.get('url'):
+            self.item_fingerprints[item['url']] = fp
+
+    def item_fingerprint(self, item) -> bytes | None:
+        return self.item_fingerprints.get(item.get('url')) if hasattr(item, 'get') else None
+
+    def forget_item(self, item):
+        if hasattr(item, 'get'):
+            self.item_fingerprints.pop(item.get('url'), None)
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms",
+                       "otherData": {"dropped_events": self.dropped_events}}, f)
+
+
+def trace_span(tracer: Tracer | None, name: str, fp: bytes, url: str = None, **args):
+    """Span context manager for components that work with and without TracingExtension"""
+    if tracer is None:
+        return nullcontext()
+    return tracer.span(name, fp, url, **args)
+
+
+class TracingExtension:
+    """
+    Records the lifecycle of sampled requests: scheduler queue, download and every item pipeline.
+    The dupefilter, BlocketSpiderMiddleware and the spider callback add their spans through crawler.tracer.
+    The trace is saved to TRACING_FILE on close and can be opened in https://ui.perfetto.dev or chrome://tracing.
+    """
+
+    def __init__(self, crawler: Crawler):
+        self.crawler = crawler
+        self.trace_file = crawler.settings.get("TRACING_FILE", "trace.json")
+        self.tracer = Tracer(crawler.settings.getfloat("TRACING_SAMPLE_RATE", 0.1),
+                             crawler.settings.getint("TRACING_MAX_EVENTS", 1000000))
+        crawler.tracer = self.tracer
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("TRACING_ENABLED"):
+            raise NotConfigured
+        ext = cls(crawler)
+        crawler.signals.connect(ext.engine_started, signal=signals.engine_started)
+        crawler.signals.connect(ext.request_scheduled, signal=signals.request_scheduled)
+        crawler.signals.connect(ext.request_dropped, signal=signals.request_dropped)
+        crawler.signals.connect(ext.request_reached_downloader, signal=signals.request_reached_downloader)
+        crawler.signals.connect(ext.request_left_downloader, signal=signals.request_left_downloader)
+        crawler.signals.connect(ext.item_done, signal=signals.item_scraped)
+        crawler.signals.connect(ext.item_done, signal=signals.item_dropped)
+        crawler.signals.connect(ext.item_done, signal=signals.item_error)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def _fingerprint(self, request) -> bytes:
+        return get_fingerprint_service(self.crawler).fingerprint(request)
+
+    def engine_started(self):
+        # Pipelines have no hooks around process_item, so their chain is wrapped once here.
+        # scraper.itemproc.methods is not a public Scrapy API, pipeline spans are skipped if it changes
+        itemproc = getattr(getattr(self.crawler.engine, "scraper", None), "itemproc", None)
+        methods = getattr(itemproc, "methods", None)
+        if not isinstance(methods, dict) or "process_item" not in methods:
+            logger.warning("Item pipeline internals of this Scrapy version are unknown, pipeline spans are not traced")
+            return
+        methods["process_item"] = type(methods["process_item"])(
+            self._traced_pipeline(m) for m in methods["process_item"])
+
+    def _traced_pipeline(self, method):
+        pipeline = getattr(getattr(method, "__wrapped__", method), "__self__", None)
+        name = f"pipeline.{type(pipeline).__name__}" if pipeline is not None else f"pipeline.{method.__qualname__}"
+
+        def traced(item, spider):
+            fp = self.tracer.item_fingerprint(item)
+            if fp is None:
+                return method(item, spider)
+            start = time.perf_counter()
+            d = maybeDeferred(method, item, spider)
+            d.addBoth(self._end_pipeline_span, name, fp, start)
+            return d
+
+        return traced
+
+    def _end_pipeline_span(self, result, name, fp, start):
+        self.tracer.add_span(name, fp, start, time.perf_counter() - start)
+        return result
+
+    def request_scheduled(self, request, spider):
+        self.tracer.begin("scheduler.queue", self._fingerprint(request))
+
+    def request_dropped(self, request, spider):
+        fp = self._fingerprint(request)
+        self.tracer.end("scheduler.queue", fp, request.url, page_type=request.meta.get("page_type"), dropped=True)
+
+    def request_reached_downloader(self, request, spider):
+        fp = self._fingerprint(request)
+        self.tracer.end("scheduler.queue", fp, request.url, page_type=request.meta.get("page_type"))
+        self.tracer.begin("downloader.download", fp)
+
+    def request_left_downloader(self, request, spider):
+        fp = self._fingerprint(request)
+        self.tracer.end("downloader.download", fp, request.url, page_type=request.meta.get("page_type"))
+
+    def item_done(self, item, spider, **kwargs):
+        self.tracer.forget_item(item)
+
+    def spider_closed(self, spider):
+        self.tracer.save(self.trace_file)
+        spider.logger.info(f"Trace with {len(self.tracer.events)} events is saved to "
+                           f"{os.path.abspath(self.trace_file)}")
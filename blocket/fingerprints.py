@@ -0,0 +1,39 @@
+from weakref import WeakKeyDictionary
+
+import scrapy
+from scrapy.crawler import Crawler
+from scrapy.utils.request import RequestFingerprinter
+
+
+class FingerprintService:
+    """
+    Computes the fingerprint of a request once with the crawler's request fingerprinter
+    and keeps it while the request object is alive. The dupefilter, the middlewares and tracing
+    all get fingerprints here, so a request is hashed once on its way through the crawler.
+    Stats: fingerprint/computed - hashes calculated, fingerprint/reused - hashes saved by the cache.
+    """
+
+    def __init__(self, fingerprinter=None, stats=None):
+        self.fingerprinter = fingerprinter or RequestFingerprinter()
+        self.stats = stats
+        self.cache: WeakKeyDictionary[scrapy.Request, bytes] = WeakKeyDictionary()
+
+    def fingerprint(self, request: scrapy.Request) -> bytes:
+        fp = self.cache.get(request)
+        if fp is None:
+            fp = self.fingerprinter.fingerprint(request)
+            self.cache[request] = fp
+            if self.stats:
+                self.stats.inc_value("fingerprint/computed")
+        elif self.stats:
+            self.stats.inc_value("fingerprint/reused")
+        return fp
+
+
+def get_fingerprint_service(crawler: Crawler) -> FingerprintService:
+    """Returns the service of the crawler, it is created by the first component that asks for it"""
+    service = getattr(crawler, "fingerprints", None)
+    if service is None:
+        service = FingerprintService(crawler.request_fingerprinter, crawler.stats)
+        crawler.fingerprints = service
+    return service
@@ -22,6 +22,7 @@ class JobItem(scrapy.Item):
     phone = scrapy.Field()
     email = scrapy.Field()
     additional_contacts = scrapy.Field()
+    duplicate_of = scrapy.Field()  # URL of the first job with the same content, set by NearDuplicatePipeline
 
 
     def __bool__(self):
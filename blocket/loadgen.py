@@ -0,0 +1,196 @@
+import itertools
+import os
+import random
+import sqlite3
+import string
+import time
+from datetime import datetime, timedelta
+
+from scrapy.http import HtmlResponse, Request
+
+from blocket.db import IdCache
+from blocket.dupefilters import JobUrlDupeFilter
+from blocket.items import JobItem
+from blocket.middlewares import BlocketSpiderMiddleware
+from blocket.pipelines import DatabasePipeline
+from blocket.spiders.blocket import PageType
+
+
+CATEGORIES = [
+    "Administration", "Bygg", "Data & IT", "Ekonomi", "Fastighet", "Försäljning", "Hotell & Restaurang",
+    "Hälso- & sjukvård", "Industri", "Installation", "Juridik", "Kultur", "Kundtjänst", "Logistik",
+    "Marknadsföring", "Pedagogik", "Personal & HR", "Säkerhet", "Teknik", "Transport", "Socialt arbete",
+]
+LOCATIONS = [
+    "Stockholm", "Göteborg", "Malmö", "Uppsala", "Västerås", "Örebro", "Linköping", "Helsingborg",
+    "Jönköping", "Norrköping", "Lund", "Umeå", "Gävle", "Borås", "Södertälje", "Eskilstuna", "Halmstad",
+    "Växjö", "Karlstad", "Sundsvall", "Luleå", "Trollhättan", "Östersund", "Borlänge", "Falun", "Kalmar",
+]
+JOB_TYPES = ["Heltid", "Deltid", "Timanställning", "Sommarjobb", "Konsultuppdrag"]
+WORDS = [
+    "vi", "söker", "erfaren", "medarbetare", "till", "vårt", "team", "i", "och", "med", "för", "du", "har",
+    "arbete", "kunder", "ansvar", "tjänsten", "erbjuder", "kollektivavtal", "ansökan", "körkort", "krav",
+    "meriterande", "utbildning", "flexibel", "självständig", "omgående", "tillträde", "lön", "enligt",
+]
+
+
+class SyntheticSite:
+    """
+    Generates realistic rows of visited_urls and jobs for a large site.
+    Companies follow a Zipf-like distribution: a few employers publish most of the ads.
+    """
+
+    def __init__(self, seed: int = 0):
+        self.random = random.Random(seed)
+        self.next_job_id = 0
+        self.companies = [f"{self._word().capitalize()} {self.random.choice(['AB', 'Sverige AB', 'Group'])}"
+                          for _ in range(50000)]
+        self.company_cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(self.companies))))
+
+    def _word(self) -> str:
+        return "".join(self.random.choices(string.ascii_lowercase, k=self.random.randint(4, 10)))
+
+    def job_url(self, job_id: int) -> str:
+        return f"https://jobb.blocket.se/ledigt-jobb-synthetic/id-{job_id}"
+
+    def job_item(self) -> JobItem:
+        """Returns the item as JobPipeline leaves it"""
+        job_id = self.next_job_id
+        self.next_job_id += 1
+        published = datetime(2024, 1, 1) + timedelta(days=self.random.randint(0, 700))
+        categories = self.random.sample(CATEGORIES, k=self.random.choice([1, 1, 1, 2, 3]))
+        return JobItem(
+            url=self.job_url(job_id),
+            title=" ".join(self.random.choices(WORDS, k=5)).capitalize(),
+            company=self.random.choices(self.companies, cum_weights=self.company_cum_weights)[0],
+            published_date=published.strftime("%Y-%m-%d"),
+            apply_date=(published + timedelta(days=self.random.randint(14, 60))).strftime("%Y-%m-%d"),
+            location=self.random.choice(LOCATIONS),
+            category=", ".join(categories),
+            job_type=self.random.choice(JOB_TYPES),
+            description=" ".join(self.random.choices(WORDS, k=self.random.randint(100, 400))),
+            processed_date=published.strftime("%Y-%m-%d %H:%M:%S"),
+        )
+
+    def visited_row(self, url: str, page_type: str) -> tuple:
+        return (self.random.randbytes(20), url, "https://jobb.blocket.se/", page_type, "processed",
+                "2024-06-01 12:00:00")
+
+
+def fill(connection: sqlite3.Connection, site: SyntheticSite, visited_count: int, jobs_per_page: float = 0.9,
+         chunk_size: int = 50000):
+    """
+    Adds rows to visited_urls until it has visited_count rows and about jobs_per_page jobs for each of them.
+    Random fingerprints are used for speed, they have the same distribution as real SHA1 fingerprints.
+    """
+    current = connection.execute("SELECT COUNT(*) FROM visited_urls").fetchone()[0]
+    id_cache = IdCache()
+    connection.execute("PRAGMA synchronous = OFF")
+    while current < visited_count:
+        n = min(chunk_size, visited_count - current)
+        jobs, visited = [], []
+        for _ in range(n):
+            if site.random.random() < jobs_per_page:
+                item = site.job_item()
+                jobs.append(item)
+                visited.append(site.visited_row(item['url'], PageType.JOB_PAGE.value))
+            else:
+                url = f"https://jobb.blocket.se/lediga-jobb?filters=synthetic&page={current}"
+                visited.append(site.visited_row(url, PageType.CATEGORY_PAGE.value))
+            current += 1
+        connection.executemany("INSERT OR IGNORE INTO visited_urls VALUES (?, ?, ?, ?, ?, ?)", visited)
+        cursor = connection.cursor()
+        for item in jobs:
+            DatabasePipeline.insert_item(cursor, item, id_cache)
+        cursor.close()
+        connection.commit()
+        id_cache.commit()
+    connection.execute("PRAGMA synchronous = FULL")
+
+
+def percentiles(latencies: list[float]) -> dict:
+    latencies = sorted(latencies)
+
+    def pick(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+
+    total = sum(latencies)
+    return {
+        "ops_per_sec": round(len(latencies) / total) if total else None,
+        "p50_ms": round(pick(0.50), 3),
+        "p95_ms": round(pick(0.95), 3),
+        "p99_ms": round(pick(0.99), 3),
+    }
+
+
+def bench_dupefilter(crawler, site: SyntheticSite, ops: int) -> dict:
+    """Half of the requests were seen before, the other half are new"""
+    dupefilter = JobUrlDupeFilter.from_crawler(crawler)
+    connection = crawler.db_connection
+    seen = [Request(site.job_url(site.next_job_id + i)) for i in range(ops // 2)]
+    # Not through the fingerprint service of the dupefilter, its cache would make the measurement meaningless
+    connection.executemany(
+        "INSERT OR IGNORE INTO visited_urls VALUES (?, ?, NULL, ?, 'processed', NULL)",
+        [(dupefilter.fingerprinter.fingerprint(r), r.url, PageType.JOB_PAGE.value) for r in seen]
+    )
+    connection.commit()
+    site.next_job_id += len(seen)
+    requests = seen + [Request(site.job_url(site.next_job_id + i)) for i in range(ops - len(seen))]
+    site.random.shuffle(requests)
+    latencies = []
+    for request in requests:
+        start = time.perf_counter()
+        dupefilter.request_seen(request)
+        latencies.append(time.perf_counter() - start)
+    dupefilter.close_spider(None)
+    return percentiles(latencies)
+
+
+def bench_middleware(crawler, spider, site: SyntheticSite, ops: int) -> dict:
+    """A job page enters the spider (in_progress) and leaves it with an item (processed)"""
+    middleware = BlocketSpiderMiddleware.from_crawler(crawler)
+    latencies = []
+    for _ in range(ops):
+        item = site.job_item()
+        request = Request(item['url'], meta={"page_type": PageType.JOB_PAGE.value})
+        response = HtmlResponse(item['url'], body=b"<html></html>", request=request)
+        start = time.perf_counter()
+        middleware.process_spider_input(response, spider)
+        for _ in middleware.process_spider_output(response, [item], spider):
+            pass
+        latencies.append(time.perf_counter() - start)
+    return percentiles(latencies)
+
+
+def bench_pipeline(crawler, spider, site: SyntheticSite, ops: int) -> dict:
+    pipeline = DatabasePipeline.from_crawler(crawler)
+    latencies = []
+    for _ in range(ops):
+        item = site.job_item()
+        start = time.perf_counter()
+        pipeline.process_item(item, spider)
+        latencies.append(time.perf_counter() - start)
+    pipeline.close_spider(spider)
+    return percentiles(latencies)
+
+
+def run_load_test(crawler, spider, db_file: str, scales: list[int], ops: int, seed: int = 0):
+    """
+    Fills the database up to every scale step and measures the DB-backed components at it.
+    Yields one result dict per scale step.
+    """
+    site = SyntheticSite(seed)
+    connection = crawler.db_connection
+    for scale in sorted(scales):
+        start = time.perf_counter()
+        fill(connection, site, scale)
+        fill_seconds = time.perf_counter() - start
+        yield {
+            "scale": scale,
+            "fill_seconds": round(fill_seconds, 1),
+            "dupefilter": bench_dupefilter(crawler, site, ops),
+            "middleware": bench_middleware(crawler, spider, site, ops),
+            "pipeline": bench_pipeline(crawler, spider, site, ops),
+            "jobs": connection.execute("SELECT COUNT(*) FROM jobs").fetchone()[0],
+            "db_size_mb": round(os.path.getsize(db_file) / 1048576, 1),
+        }
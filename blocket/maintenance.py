@@ -0,0 +1,138 @@
+import logging
+import sqlite3
+from datetime import datetime, timedelta
+
+from blocket.db import rebuild_company_stats
+
+
+logger = logging.getLogger(__name__)
+
+
+# The archive is self-contained, jobs are stored in the shape of jobs_view
+ARCHIVE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS archive.jobs (
+        id INTEGER PRIMARY KEY,
+        url TEXT UNIQUE,
+        title TEXT,
+        company TEXT,
+        published_date TEXT,
+        apply_date TEXT,
+        location TEXT,
+        category TEXT,
+        job_type TEXT,
+        description TEXT,
+        processed_date TEXT,
+        phone TEXT,
+        email TEXT,
+        additional_contacts TEXT,
+        archived_date TEXT
+    );
+'''
+
+JOB_COLUMNS = '''
+    url, title, company, published_date, apply_date, location, category, job_type, description,
+    processed_date, phone, email, additional_contacts
+'''
+
+
+def delete_old_visited_urls(connection: sqlite3.Connection, page_types: list[str], days: int) -> int:
+    """
+    Deletes processed rows of the given page types from visited_urls if they were processed more than days ago.
+    Rows "in_progress" are kept because the spider resumes them on the next start.
+    """
+    if not page_types:
+        return 0
+    border_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    placeholders = ", ".join("?" for _ in page_types)
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f'''
+        DELETE FROM visited_urls
+        WHERE status = "processed" AND last_processed_date < ? AND page_type IN ({placeholders})
+        ''', (border_date, *page_types))
+        deleted = cursor.rowcount
+        connection.commit()
+    finally:
+        cursor.close()
+    return deleted
+
+
+def archive_expired_jobs(connection: sqlite3.Connection, archive_file: str, days: int = 0) -> int:
+    """
+    Moves jobs whose apply_date passed more than days ago to the jobs table of the archive database.
+    The near-duplicate index is cleaned of URLs that are no longer or never were in jobs.
+    Company statistics are recalculated if any job was moved.
+    """
+    border_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+    archived_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    cursor = connection.cursor()
+    cursor.execute("ATTACH DATABASE ? AS archive", (archive_file,))
+    try:
+        cursor.executescript(ARCHIVE_SCHEMA)
+        cursor.execute(f'''
+        INSERT OR REPLACE INTO archive.jobs ({JOB_COLUMNS}, archived_date)
+        SELECT {JOB_COLUMNS}, ? FROM main.jobs_view
+        WHERE apply_date < ?
+        ''', (archived_date, border_date))
+        cursor.execute('''
+        DELETE FROM main.job_categories
+        WHERE job_id IN (SELECT id FROM main.jobs WHERE apply_date < ?)
+        ''', (border_date,))
+        cursor.execute("DELETE FROM main.jobs WHERE apply_date < ?", (border_date,))
+        archived = cursor.rowcount
+        # The near-duplicate index keeps only stored jobs: archived ones and jobs that never got a row in jobs
+        for table in ("job_lsh_buckets", "job_minhash"):
+            cursor.execute(f"DELETE FROM main.{table} WHERE url NOT IN (SELECT url FROM main.jobs)")
+        connection.commit()
+    except sqlite3.Error:
+        connection.rollback()
+        raise
+    finally:
+        cursor.execute("DETACH DATABASE archive")
+        cursor.close()
+    if archived:
+        rebuild_company_stats(connection)
+    return archived
+
+
+def compact(connection: sqlite3.Connection):
+    """
+    Returns free pages to the file system and refreshes the query planner statistics.
+    Databases created without auto_vacuum are converted with one full VACUUM,
+    after that only the incremental vacuum is needed.
+    """
+    cursor = connection.cursor()
+    try:
+        auto_vacuum = cursor.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if auto_vacuum != 2:
+            logger.info("Converting database to auto_vacuum = INCREMENTAL with full VACUUM")
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            cursor.execute("VACUUM")
+        else:
+            # executescript steps the pragma to the end, execute() frees only one page
+            cursor.executescript("PRAGMA incremental_vacuum;")
+        cursor.execute("ANALYZE")
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+def run_maintenance(connection: sqlite3.Connection, settings) -> dict:
+    """
+    Applies the retention policies from settings and compacts the database.
+    Should not run at the same time as a crawl: VACUUM needs exclusive access to the database.
+    """
+    result = {}
+    category_days = settings.get("RETENTION_CATEGORY_PAGE_DAYS")
+    if category_days is not None:
+        result["category_pages_deleted"] = delete_old_visited_urls(
+            connection, ["main_page", "category_page"], int(category_days))
+    job_days = settings.get("RETENTION_JOB_PAGE_DAYS")
+    if job_days is not None:
+        result["job_pages_deleted"] = delete_old_visited_urls(connection, ["job_page"], int(job_days))
+    if settings.getbool("RETENTION_ARCHIVE_EXPIRED_JOBS"):
+        result["jobs_archived"] = archive_expired_jobs(
+            connection, settings.get("ARCHIVE_SQLITE_FILE"), settings.getint("RETENTION_EXPIRED_JOB_DAYS", 0))
+    if settings.getbool("RETENTION_COMPACT", True):
+        compact(connection)
+    return result
@@ -2,16 +2,22 @@
 #
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
+import json
 import logging
+import zlib
 from datetime import datetime
 from typing import Optional
 import sqlite3
 import scrapy
 from pandas.io.sas.sas_constants import page_type_mask
-from scrapy.utils.request import fingerprint
 from scrapy import signals
+from scrapy.exceptions import NotConfigured
 from twisted.internet.defer import DeferredLock
 
+from blocket.db import open_page_archive
+from blocket.extensions import trace_span
+from blocket.fingerprints import get_fingerprint_service
+
 
 class BlocketSpiderMiddleware:
     # Not all methods need to be defined. If a method is not defined,
@@ -23,6 +29,8 @@ class BlocketSpiderMiddleware:
         self.lock = DeferredLock()
         self.children_request_counts = {}  # dict
         self.connection: Optional[sqlite3.Connection] = crawler.db_connection
+        self.tracer = getattr(crawler, 'tracer', None)
+        self.fingerprints = get_fingerprint_service(crawler)
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -41,10 +49,11 @@ class BlocketSpiderMiddleware:
         Should return None or raise an exception.
         """
         url = response.url
-        fp = fingerprint(response.request)
+        fp = self.fingerprints.fingerprint(response.request)
         parent_url = response.meta.get('parent_url')
         page_type = response.meta.get('page_type')
-        self._mark_url_in_progress(fp, url, parent_url, page_type)
+        with trace_span(self.tracer, "middleware.input", fp, url, page_type=page_type):
+            self._mark_url_in_progress(fp, url, parent_url, page_type)
         return None
 
     def process_spider_output(self, response, result, spider):
@@ -59,11 +68,14 @@ class BlocketSpiderMiddleware:
         # Getting parent URL and parent fingerprint from metadata
         parent_fp = response.meta.get('parent_fp')
         parent_url = response.meta.get('parent_url')
-        fp = fingerprint(response.request)
+        fp = self.fingerprints.fingerprint(response.request)
         url = response.url
         # Init counter for child requests
         pending_requests = []
         item_count = 0
+        # Callbacks parsing in the process pool record their span themselves, here their result is a ready list
+        if self.tracer and not response.meta.get('callback_traced'):
+            result = self.tracer.timed_iter(result, "spider.callback", fp, url, page_type=response.meta.get('page_type'))
         for item in result:
             if isinstance(item, scrapy.Request):
                 # Set Metadata parent_url и fingerprint for all child request
@@ -75,6 +87,8 @@ class BlocketSpiderMiddleware:
                     pending_requests.append(item)
             else:
                 item_count += 1
+                if self.tracer:
+                    self.tracer.link_item(item, fp)
                 yield item
 
         if pending_requests:
@@ -154,13 +168,14 @@ class BlocketSpiderMiddleware:
         last_processed_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         cursor = self.connection.cursor()
         try:
-            cursor.execute('''
-            UPDATE visited_urls 
-            SET status = "processed", last_processed_date = ?          
-            WHERE fingerprint = ?
-            ''',
-                           (last_processed_date, fp,))
-            self.connection.commit()
+            with trace_span(self.tracer, "middleware.mark_processed", fp, url):
+                cursor.execute('''
+                UPDATE visited_urls 
+                SET status = "processed", last_processed_date = ?          
+                WHERE fingerprint = ?
+                ''',
+                               (last_processed_date, fp,))
+                self.connection.commit()
         except sqlite3.Error as e:
             self.logger.error(f"Error marking URL {url} as processed: {e}")
         finally:
@@ -194,3 +209,53 @@ class BlocketSpiderMiddleware:
             #         self._mark_url_processed(parent_fp, parent_url)
 
 
+class PageArchiveMiddleware:
+    """
+    Saves zlib-compressed raw bodies of responses to PAGE_ARCHIVE_FILE keyed by the fingerprint from visited_urls.
+    Archived pages can be parsed again without network with "scrapy reparse".
+    """
+    # Meta keys that are needed to call spider callbacks for archived pages
+    meta_keys = ("page_type", "category", "page_number", "link_number")
+
+    def __init__(self, crawler):
+        bot_name = crawler.settings.get('BOT_NAME', 'scrapy_project')
+        self.logger = logging.getLogger(bot_name)
+        self.page_types = set(crawler.settings.getlist("PAGE_ARCHIVE_PAGE_TYPES"))
+        self.commit_size = crawler.settings.getint("PAGE_ARCHIVE_COMMIT_SIZE", 50)
+        self.connection = open_page_archive(crawler.settings.get("PAGE_ARCHIVE_FILE"))
+        self.fingerprints = get_fingerprint_service(crawler)
+        self.uncommitted = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("PAGE_ARCHIVE_ENABLED"):
+            raise NotConfigured
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def process_spider_input(self, response, spider):
+        page_type = response.meta.get('page_type')
+        if page_type not in self.page_types:
+            return None
+        meta = {key: response.meta[key] for key in self.meta_keys if key in response.meta}
+        try:
+            self.connection.execute('''
+            INSERT OR REPLACE INTO page_archive (fingerprint, url, page_type, meta, encoding, body, archived_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                self.fingerprints.fingerprint(response.request), response.url, page_type, json.dumps(meta),
+                getattr(response, 'encoding', None), zlib.compress(response.body),
+                datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            ))
+            self.uncommitted += 1
+            if self.uncommitted >= self.commit_size:
+                self.connection.commit()
+                self.uncommitted = 0
+        except sqlite3.Error as e:
+            self.logger.error(f"Error archiving page {response.url}: {e}")
+        return None
+
+    def spider_closed(self, spider):
+        self.connection.commit()
+        self.connection.close()
@@ -0,0 +1,61 @@
+import hashlib
+import re
+import zlib
+
+import numpy as np
+
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+class MinHasher:
+    """
+    MinHash signatures of texts and their LSH band keys.
+    With num_perm = bands * rows, two texts share at least one band with probability 1 - (1 - s^rows)^bands
+    where s is the Jaccard similarity of their word shingles.
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 16, shingle_size: int = 3, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str) -> set[str]:
+        words = re.findall(r"\w+", text.lower())
+        if len(words) <= self.shingle_size:
+            return {" ".join(words)} if words else set()
+        return {" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    def signature(self, text: str) -> np.ndarray | None:
+        shingles = self.shingles(text)
+        if not shingles:
+            return None
+        hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles))
+        # Universal hashing (a * h + b) mod p for all permutations at once; uint64 overflow is intended
+        permuted = (np.outer(hashes, self.a) + self.b) % MERSENNE_PRIME & MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def band_keys(self, signature: np.ndarray) -> list[bytes]:
+        """One 8-byte key for every band of the signature"""
+        return [hashlib.blake2b(signature[i * self.rows:(i + 1) * self.rows].tobytes(), digest_size=8).digest()
+                for i in range(self.bands)]
+
+    @staticmethod
+    def similarity(signature: np.ndarray, other: np.ndarray) -> float:
+        """Estimated Jaccard similarity"""
+        return float(np.mean(signature == other))
+
+    @staticmethod
+    def to_blob(signature: np.ndarray) -> bytes:
+        return signature.tobytes()
+
+    @staticmethod
+    def from_blob(blob: bytes) -> np.ndarray:
+        return np.frombuffer(blob, dtype=np.uint32)
@@ -2,8 +2,13 @@
 #
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
+import gzip
+import json
 import logging
+import os
 import re
+import shutil
+import time
 from sqlite3 import IntegrityError
 
 import scrapy
@@ -16,18 +21,30 @@ import pandas as pd
 from openpyxl.reader.excel import load_workbook
 from scrapy.crawler import Crawler
 
-from scrapy.exceptions import DropItem
+from scrapy.exceptions import DropItem, NotConfigured
+from twisted.internet.defer import DeferredList
+from twisted.internet.task import LoopingCall
+from twisted.internet.threads import deferToThread
 from unicodedata import category
 
+from blocket.db import IdCache, insert_job
+from blocket.minhash import MinHasher
+
 
 class JobPipeline:
 
+    def __init__(self, relative_base: datetime | None = None):
+        # Date when the page was downloaded, dates without a year and relative dates are counted from it.
+        # None - now, as for pages of the running crawl
+        self.relative_base = relative_base
+
     def process_item(self, item, spider):
         item['url'] = item['url'].strip() if item.get('url') else None
         item['title'] = item['title'].strip() if item.get('title') else None
         item['company'] = item['company'].strip() if item.get('company') else None
-        item['published_date'] = self.convert_date(item['published_date']) if item.get('published_date') else None
-        item['apply_date'] = self.convert_date(item['apply_date']) if item.get('apply_date') else None
+        item['published_date'] = self.convert_date(item['published_date'], self.relative_base) \
+            if item.get('published_date') else None
+        item['apply_date'] = self.convert_date(item['apply_date'], self.relative_base) if item.get('apply_date') else None
         item['location'] = item['location'].strip() if item.get('location') else None
         item['category'] = ', '.join([c.strip() for c in item['category']]) if item.get('category') else None
         # if job_type from HTML
@@ -48,11 +65,12 @@ class JobPipeline:
         return item
 
     @staticmethod
-    def convert_date(swedish_date: str) -> str | None:
+    def convert_date(swedish_date: str, relative_base: datetime | None = None) -> str | None:
         try:
             if len(swedish_date.split()) == 2 and ":" not in swedish_date:
-                swedish_date = f"{swedish_date} {datetime.now().year}"
-            date_obj = parse(swedish_date, languages=['sv'])
+                swedish_date = f"{swedish_date} {(relative_base or datetime.now()).year}"
+            date_obj = parse(swedish_date, languages=['sv'],
+                             settings={'RELATIVE_BASE': relative_base} if relative_base else None)
             return date_obj.strftime("%Y-%m-%d")
         except (ValueError, AttributeError):
             return None
@@ -73,9 +91,154 @@ class JobPipeline:
         return "\n".join(output) if output else None
 
 
+class NearDuplicatePipeline:
+    """
+    Finds reposted jobs with MinHash signatures of title and description.
+    Signatures and LSH buckets are kept in job_minhash and job_lsh_buckets, so only the jobs sharing
+    a bucket with the new one are compared, and the index grows from run to run.
+    A near-duplicate gets duplicate_of with the URL of the first job of its cluster.
+    With NEAR_DUPLICATE_ACTION = "drop" it is dropped instead of being saved.
+    Jobs stored after the last index build are indexed when the spider opens.
+    With NEAR_DUPLICATE_ACTION = "drop" dropped jobs are not indexed, they never get a row in jobs.
+    """
+
+    index_name = "jobs"
+    index_batch_size = 500
+
+    def __init__(self, crawler):
+        self.connection = crawler.db_connection
+        self.stats = crawler.stats
+        settings = crawler.settings
+        self.threshold = settings.getfloat("NEAR_DUPLICATE_THRESHOLD", 0.8)
+        self.action = settings.get("NEAR_DUPLICATE_ACTION", "flag")
+        self.max_candidates = settings.getint("NEAR_DUPLICATE_MAX_CANDIDATES", 100)
+        self.hasher = MinHasher(num_perm=settings.getint("NEAR_DUPLICATE_NUM_PERM", 128),
+                                bands=settings.getint("NEAR_DUPLICATE_BANDS", 16))
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("NEAR_DUPLICATE_ENABLED"):
+            raise NotConfigured
+        return cls(crawler)
+
+    def open_spider(self, spider):
+        indexed = self.build_index()
+        if indexed:
+            spider.logger.info(f"Indexed {indexed} existing jobs for near-duplicate search")
+
+    def build_index(self) -> int:
+        """
+        Indexes jobs stored after the last build, the oldest first, so that the first job of a cluster stays its head.
+        Jobs stored by a crawl with this pipeline are already indexed and are skipped.
+        Returns the number of indexed jobs
+        """
+        read_cursor = self.connection.cursor()
+        cursor = self.connection.cursor()
+        indexed = 0
+        try:
+            row = cursor.execute("SELECT last_id FROM near_duplicate_state WHERE name = ?",
+                                 (self.index_name,)).fetchone()
+            max_id = cursor.execute("SELECT IFNULL(MAX(id), 0) FROM jobs").fetchone()[0]
+            read_cursor.execute('''
+            SELECT j.id, j.url, j.title, j.description FROM jobs j
+            WHERE j.id > ? AND j.id <= ? AND NOT EXISTS (SELECT 1 FROM job_minhash m WHERE m.url = j.url)
+            ORDER BY j.id
+            ''', (row[0] if row else 0, max_id))
+            for rows in iter(lambda: read_cursor.fetchmany(self.index_batch_size), []):
+                for job_id, url, title, description in rows:
+                    signature = self.hasher.signature(f"{title or ''}\n{description or ''}")
+                    if signature is not None:
+                        self._index(cursor, url, signature)
+                        indexed += 1
+                # An interrupted build continues after the last committed batch
+                self._save_index_mark(cursor, job_id)
+                self.connection.commit()
+            # Jobs of the previous crawl were indexed by process_item and are skipped next time too
+            self._save_index_mark(cursor, max_id)
+            self.connection.commit()
+        except sqlite3.Error:
+            self.connection.rollback()
+            raise
+        finally:
+            read_cursor.close()
+            cursor.close()
+        return indexed
+
+    def _save_index_mark(self, cursor: sqlite3.Cursor, last_id: int):
+        cursor.execute('''
+        INSERT INTO near_duplicate_state (name, last_id, indexed_date) VALUES (?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET last_id = MAX(last_id, excluded.last_id), indexed_date = excluded.indexed_date
+        ''', (self.index_name, last_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+    def process_item(self, item, spider):
+        url = item.get('url')
+        item['duplicate_of'] = None
+        signature = self.hasher.signature(f"{item.get('title') or ''}\n{item.get('description') or ''}")
+        if signature is None:
+            return item
+        cursor = self.connection.cursor()
+        try:
+            if cursor.execute("SELECT 1 FROM job_minhash WHERE url = ?", (url,)).fetchone():
+                return item
+            band_keys = self.hasher.band_keys(signature)
+            duplicate_of = self._find_duplicate(cursor, url, signature, band_keys)
+            # A dropped job is never stored, its signature would only grow the candidate buckets
+            if not (duplicate_of and self.action == "drop"):
+                self._add_signature(cursor, url, signature, band_keys, duplicate_of)
+                self.connection.commit()
+        except sqlite3.Error as e:
+            self.connection.rollback()
+            spider.logger.error(f"Error checking near-duplicates of {url}: {e}")
+            return item
+        finally:
+            cursor.close()
+
+        if duplicate_of:
+            self.stats.inc_value("near_duplicate/found")
+            item['duplicate_of'] = duplicate_of
+            if self.action == "drop":
+                raise DropItem(f"Near-duplicate of {duplicate_of}")
+        return item
+
+    def _index(self, cursor: sqlite3.Cursor, url: str, signature):
+        band_keys = self.hasher.band_keys(signature)
+        duplicate_of = self._find_duplicate(cursor, url, signature, band_keys)
+        self._add_signature(cursor, url, signature, band_keys, duplicate_of)
+
+    def _add_signature(self, cursor: sqlite3.Cursor, url: str, signature, band_keys: list, duplicate_of: str | None):
+        cursor.execute("INSERT INTO job_minhash (url, signature, duplicate_of) VALUES (?, ?, ?)",
+                       (url, self.hasher.to_blob(signature), duplicate_of))
+        cursor.executemany("INSERT OR IGNORE INTO job_lsh_buckets (band, bucket, url) VALUES (?, ?, ?)",
+                           [(band, key, url) for band, key in enumerate(band_keys)])
+
+    def _find_duplicate(self, cursor: sqlite3.Cursor, url: str, signature, band_keys: list) -> str | None:
+        """Returns the cluster URL of the most similar candidate if it is similar enough"""
+        candidates = set()
+        for band, key in enumerate(band_keys):
+            cursor.execute("SELECT url FROM job_lsh_buckets WHERE band = ? AND bucket = ? LIMIT ?",
+                           (band, key, self.max_candidates))
+            candidates.update(row[0] for row in cursor)
+        candidates.discard(url)
+        if not candidates:
+            return None
+        best_similarity, best = 0.0, None
+        candidates = list(candidates)
+        for i in range(0, len(candidates), 500):
+            chunk = candidates[i:i + 500]
+            cursor.execute(
+                f"SELECT url, signature, duplicate_of FROM job_minhash WHERE url IN ({', '.join('?' * len(chunk))})",
+                chunk)
+            for candidate_url, blob, candidate_duplicate_of in cursor.fetchall():
+                similarity = self.hasher.similarity(signature, self.hasher.from_blob(blob))
+                if similarity > best_similarity:
+                    best_similarity, best = similarity, candidate_duplicate_of or candidate_url
+        return best if best_similarity >= self.threshold else None
+
+
 class DatabasePipeline:
     def __init__(self, crawler):
         self.connection = crawler.db_connection
+        self.id_cache: IdCache = getattr(crawler, "id_cache", None) or IdCache()
         self.settings = crawler.settings
         self.item_counter = 0
 
@@ -88,23 +251,13 @@ class DatabasePipeline:
 
     def process_item(self, item, spider):
         try:
-            self.cursor.execute(
-                '''
-                INSERT INTO jobs (
-                url, title, company, published_date, apply_date, location, category, job_type, description, 
-                processed_date, phone, email, additional_contacts
-                ) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    item.get('url'), item.get('title'), item.get('company'),
-                    item.get('published_date'), item.get('apply_date'), item.get('location'),
-                    item.get('category'), item.get('job_type'), item.get('description'), item.get('processed_date'),
-                    item.get('phone'), item.get('email'), item.get('additional_contacts')
-                )
-            )
+            self.insert_item(self.cursor, item, self.id_cache)
             self.connection.commit()
+            self.id_cache.commit()
 
         except IntegrityError:
+            self.connection.rollback()
+            self.id_cache.rollback()
             spider.logger.info(f"Drop item {item['url']}. URL already exists in the database.")
             raise DropItem()
         else:
@@ -113,6 +266,11 @@ class DatabasePipeline:
                 spider.logger.info(f"~~~Added {self.item_counter} jobs")
         return item
 
+    @staticmethod
+    def insert_item(cursor: sqlite3.Cursor, item, id_cache: IdCache):
+        """Inserts the job and updates company statistics. The caller is responsible for commit"""
+        insert_job(cursor, item, id_cache)
+
     def close_spider(self, spider):
         self.cursor.close()
 
@@ -150,8 +308,12 @@ class ExcelSavePipeline:
         return item
 
     def save_data_to_excel(self):
+        self.write_items(self.items)
+        self.items.clear()
 
-        df = pd.DataFrame(self.items)
+    def write_items(self, items: list):
+        """Appends items to the Excel file below the rows already written"""
+        df = pd.DataFrame(items)
         header_enabled = False if self.start_row else True
 
         writer_params = {
@@ -165,8 +327,6 @@ class ExcelSavePipeline:
             df.to_excel(writer, sheet_name=self.sheet_name, index=False, header=header_enabled, startrow=self.start_row)
             self.start_row += len(df)
 
-        self.items.clear()
-
     def close_spider(self, spider):
         if self.items:
             self.save_data_to_excel()
@@ -174,38 +334,316 @@ class ExcelSavePipeline:
 
 class ExcelFinalExportPipeline:
     """
-    Save the all data to xlsx
+    Save the all data to xlsx.
+    With EXCEL_EXPORT_MODE = "delta" only jobs added or processed again since the previous export
+    are saved to a dated delta file next to EXCEL_FILE_FROM_DB. The first export is always full.
     """
 
+    export_name = "excel_from_db"
+
     def __init__(self):
         self.excel_file = None
+        self.mode = "full"
 
     def open_spider(self, spider: scrapy.Spider):
         self.excel_file = spider.settings.get("EXCEL_FILE_FROM_DB")
+        self.mode = spider.settings.get("EXCEL_EXPORT_MODE", "full")
 
     def close_spider(self, spider):
-        spider.logger.info(f"Start saving all records to {self.excel_file}")
-        connection = spider.crawler.db_connection
+        self.export_with_log(spider.crawler.db_connection, spider.logger)
+
+    def export_with_log(self, connection: sqlite3.Connection, logger: logging.Logger):
+        if self.mode == "delta":
+            logger.info(f"Start saving new and changed records since the last export of {self.excel_file}")
+            delta_file, record_count = self.export_delta(connection, self.excel_file)
+            if delta_file:
+                logger.info(f"{record_count} records are saved to {delta_file}")
+            else:
+                logger.info("No new or changed records since the last export")
+        else:
+            logger.info(f"Start saving all records to {self.excel_file}")
+            record_count = self.export(connection, self.excel_file)
+            logger.info(f"Total record count in DB {record_count}")
+            logger.info(f"All records are saved to {self.excel_file}")
+
+    @classmethod
+    def _read_jobs(cls, connection: sqlite3.Connection, where: str = "", params: tuple = ()) -> pd.DataFrame:
+        # Company counters are maintained by DatabasePipeline in company_stats,
+        # jobs_view joins the lookup tables back to the columns of the export
+        # change_seq is only for the high-water mark and is not written to Excel
+        query = f'''
+        SELECT j.*, c.jobs_count AS company_jobs_in_db, m.duplicate_of, jj.change_seq
+        FROM jobs_view j
+        JOIN jobs jj ON jj.id = j.id
+        LEFT JOIN company_stats c ON c.company_id = jj.company_id
+        LEFT JOIN job_minhash m ON j.url = m.url
+        {where}
+        ORDER BY j.published_date DESC;
+        '''
+        return pd.read_sql_query(query, connection, params=params)
+
+    @classmethod
+    def _save_high_water_mark(cls, connection: sqlite3.Connection, df: pd.DataFrame):
+        """Remembers the last exported id, processed_date and change_seq, the next delta starts after them"""
+        change_seqs = df['change_seq'].dropna()
+        connection.execute('''
+        INSERT INTO export_state (name, last_id, last_processed_date, exported_date, last_change_seq)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET
+            last_id = MAX(last_id, excluded.last_id),
+            last_processed_date = MAX(last_processed_date, excluded.last_processed_date),
+            exported_date = excluded.exported_date,
+            last_change_seq = MAX(last_change_seq, excluded.last_change_seq)
+        ''', (cls.export_name, int(df['id'].max()) if not df.empty else 0,
+              df['processed_date'].max() if not df.empty else '', datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+              int(change_seqs.max()) if not change_seqs.empty else 0))
+        connection.commit()
+
+    @classmethod
+    def export(cls, connection: sqlite3.Connection, excel_file: str) -> int:
+        """Saves all jobs from DB to Excel file and returns the number of saved records"""
         # Создание индекса, если нужно
         cursor = connection.cursor()
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_company ON jobs(company);')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_published_date ON jobs(published_date DESC);')
         connection.commit()
-        query = '''
-        SELECT j.*, c.company_jobs_in_db 
-        FROM jobs j
-        LEFT JOIN (
-            SELECT company, COUNT(*) AS company_jobs_in_db
-            FROM jobs
-            GROUP BY company
-        ) c ON j.company = c.company
-        ORDER BY j.published_date DESC;
-        '''
-        df = pd.read_sql_query(query, connection)
-        cursor.execute('DROP INDEX IF EXISTS idx_company;')
+        df = cls._read_jobs(connection)
         cursor.execute('DROP INDEX IF EXISTS idx_published_date;')
         connection.commit()
-        record_count = df.shape[0]
-        spider.logger.info(f"Total record count in DB {record_count}")
-        df.to_excel(self.excel_file, index=False)
-        spider.logger.info(f"All records are saved to {self.excel_file}")
+        cursor.close()
+        df.drop(columns='change_seq').to_excel(excel_file, index=False)
+        cls._save_high_water_mark(connection, df)
+        return df.shape[0]
+
+    @classmethod
+    def export_delta(cls, connection: sqlite3.Connection, excel_file: str) -> tuple[str | None, int]:
+        """
+        Saves jobs with id, processed_date or change_seq above the high-water mark of the previous export
+        to "<excel_file name>_delta_<date>.xlsx". Returns the delta file (None if there are no rows)
+        and the number of saved records. Without a previous export the full export is done.
+        """
+        state = connection.execute(
+            "SELECT last_id, last_processed_date, last_change_seq FROM export_state WHERE name = ?",
+            (cls.export_name,)
+        ).fetchone()
+        if state is None:
+            return excel_file, cls.export(connection, excel_file)
+        df = cls._read_jobs(connection, "WHERE j.id > ? OR j.processed_date > ? OR jj.change_seq > ?", state)
+        if df.empty:
+            return None, 0
+        stem, ext = os.path.splitext(excel_file)
+        delta_file = f"{stem}_delta_{datetime.now().strftime('%Y%m%d_%H%M%S')}{ext}"
+        df.drop(columns='change_seq').to_excel(delta_file, index=False)
+        cls._save_high_water_mark(connection, df)
+        return delta_file, df.shape[0]
+
+
+class NdjsonFeedPipeline:
+    """
+    Appends items to NDJSON segments in NDJSON_FEED_DIR for streaming consumers.
+
+    The active segment is "segment-NNNNNN.ndjson.part". Writes are buffered and fsynced after
+    NDJSON_FEED_FSYNC_BYTES bytes or NDJSON_FEED_FSYNC_SECONDS seconds. After NDJSON_FEED_ROTATE_BYTES bytes or
+    NDJSON_FEED_ROTATE_SECONDS seconds the segment is atomically renamed to "segment-NNNNNN.ndjson"
+    (or compressed to ".ndjson.gz" with NDJSON_FEED_COMPRESS).
+    manifest.json lists finished segments with record offsets and the number of synced bytes of the active
+    segment, so consumers can tail it while the crawl is running.
+    Time limits are checked by a timer, so an idle crawl still publishes buffered items.
+    Segments are compressed in a thread and listed in "finishing" until the compressed file is ready.
+    """
+
+    manifest_name = "manifest.json"
+
+    def __init__(self, settings):
+        self.feed_dir = settings.get("NDJSON_FEED_DIR")
+        self.buffer_size = settings.getint("NDJSON_FEED_BUFFER_SIZE", 65536)
+        self.fsync_bytes = settings.getint("NDJSON_FEED_FSYNC_BYTES", 1048576)
+        self.fsync_seconds = settings.getfloat("NDJSON_FEED_FSYNC_SECONDS", 5)
+        self.rotate_bytes = settings.getint("NDJSON_FEED_ROTATE_BYTES", 67108864)
+        self.rotate_seconds = settings.getfloat("NDJSON_FEED_ROTATE_SECONDS", 3600)
+        self.compress = settings.getbool("NDJSON_FEED_COMPRESS", False)
+        self.manifest = {"next_offset": 0, "next_segment": 0, "segments": [], "active": None}
+        self.file = None
+        self.active = None
+        self.unsynced_bytes = 0
+        self.synced_time = 0
+        self.opened_time = 0
+        self.timer = LoopingCall(self._check_limits)
+        self.compressing = set()
+        self.logger = logging.getLogger(settings.get('BOT_NAME', 'scrapy_project'))
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("NDJSON_FEED_ENABLED"):
+            raise NotConfigured
+        return cls(crawler.settings)
+
+    def open_spider(self, spider):
+        os.makedirs(self.feed_dir, exist_ok=True)
+        manifest_path = os.path.join(self.feed_dir, self.manifest_name)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        self.manifest.setdefault("finishing", [])
+        for active in list(self.manifest["finishing"]):
+            self._recover_finishing_segment(active)
+        if self.manifest["active"]:
+            self._recover_active_segment()
+        self._open_segment()
+        self.timer.start(max(0.05, min(self.fsync_seconds, self.rotate_seconds)), now=False)
+
+    def process_item(self, item, spider):
+        line = json.dumps(ItemAdapter(item).asdict(), ensure_ascii=False, default=str) + "\n"
+        data = line.encode("utf-8")
+        self.file.write(data)
+        self.active["records"] += 1
+        self.active["bytes"] += len(data)
+        self.unsynced_bytes += len(data)
+        self.manifest["next_offset"] += 1
+        self._check_limits()
+        return item
+
+    def _check_limits(self):
+        """Called for every item and by the timer"""
+        now = time.monotonic()
+        if self.active["records"] and (self.active["bytes"] >= self.rotate_bytes
+                                       or now - self.opened_time >= self.rotate_seconds):
+            self._rotate()
+            self._open_segment()
+        elif self.unsynced_bytes and (self.unsynced_bytes >= self.fsync_bytes
+                                      or now - self.synced_time >= self.fsync_seconds):
+            self._sync()
+
+    def close_spider(self, spider):
+        if self.timer.running:
+            self.timer.stop()
+        if self.active["records"]:
+            self._rotate()
+        else:
+            self.file.close()
+            os.remove(self._path(self.active["name"]))
+            self.manifest["active"] = None
+            self._write_manifest()
+        if self.compressing:
+            return DeferredList(list(self.compressing))
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.feed_dir, name)
+
+    def _open_segment(self):
+        name = f"segment-{self.manifest['next_segment']:06d}.ndjson.part"
+        self.manifest["next_segment"] += 1
+        self.active = {
+            "name": name,
+            "first_offset": self.manifest["next_offset"],
+            "records": 0,
+            "bytes": 0,
+            "synced_bytes": 0,
+        }
+        self.manifest["active"] = self.active
+        self.file = open(self._path(name), "wb", buffering=self.buffer_size)
+        self.unsynced_bytes = 0
+        self.opened_time = self.synced_time = time.monotonic()
+        self._write_manifest()
+
+    def _sync(self):
+        """Flushes the buffer to disk and publishes the synced size of the active segment"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.active["synced_bytes"] = self.active["bytes"]
+        self.unsynced_bytes = 0
+        self.synced_time = time.monotonic()
+        self._write_manifest()
+
+    def _rotate(self):
+        """Finishes the active segment: renames (or compresses in a thread) it and moves it to the segment list"""
+        self._sync()
+        self.file.close()
+        self.file = None
+        active = self.active
+        self.manifest["active"] = None
+        if not self.compress:
+            os.replace(self._path(active["name"]), self._path(self._segment_name(active)))
+            self._publish_segment(active)
+            return
+        # A crash during compression is finished by _recover_finishing_segment on the next start
+        active["finished_name"] = self._segment_name(active)
+        self.manifest["finishing"].append(active)
+        self._write_manifest()
+        d = deferToThread(self._compress_segment, active)
+        self.compressing.add(d)
+        d.addCallback(lambda _: self._publish_segment(active))
+        d.addErrback(lambda failure: self.logger.error(
+            f"Error compressing NDJSON segment {active['name']}: {failure.getErrorMessage()}"))
+        d.addBoth(lambda _: self.compressing.discard(d))
+
+    def _segment_name(self, active: dict) -> str:
+        if "finished_name" in active:
+            return active["finished_name"]
+        name = active["name"].removesuffix(".part")
+        return name + ".gz" if self.compress else name
+
+    def _compress_segment(self, active: dict):
+        """Runs in a thread, only works with files"""
+        part_path = self._path(active["name"])
+        path = self._path(self._segment_name(active))
+        tmp_path = path + ".tmp"
+        with open(part_path, "rb") as src, gzip.open(tmp_path, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        os.remove(part_path)
+
+    def _publish_segment(self, active: dict):
+        """Adds the finished segment to the manifest, segments compressed in parallel are kept in offset order"""
+        if active in self.manifest["finishing"]:
+            self.manifest["finishing"].remove(active)
+        self.manifest["segments"].append({
+            "name": self._segment_name(active),
+            "first_offset": active["first_offset"],
+            "records": active["records"],
+            "bytes": active["bytes"],
+            "finished_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        })
+        self.manifest["segments"].sort(key=lambda segment: segment["first_offset"])
+        self._write_manifest()
+
+    def _recover_finishing_segment(self, active: dict):
+        """Completes the compression of a segment interrupted by a crash"""
+        if os.path.exists(self._path(active["name"])):
+            self._compress_segment(active)
+        self._publish_segment(active)
+
+    def _recover_active_segment(self):
+        """
+        Finishes the segment left by a previous run. Only the synced part is kept:
+        records after it may be incomplete and were not published to consumers.
+        """
+        active = self.manifest["active"]
+        part_path = self._path(active["name"])
+        if not os.path.exists(part_path) or not active["synced_bytes"]:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            self.manifest["next_offset"] = active["first_offset"]
+            self.manifest["active"] = None
+            return
+        with open(part_path, "r+b") as f:
+            f.truncate(active["synced_bytes"])
+            f.seek(0)
+            active["records"] = sum(1 for _ in f)
+        active["bytes"] = active["synced_bytes"]
+        self.manifest["next_offset"] = active["first_offset"] + active["records"]
+        self.manifest["active"] = None
+        if self.compress:
+            self._compress_segment(active)
+        else:
+            os.replace(part_path, self._path(self._segment_name(active)))
+        self._publish_segment(active)
+
+    def _write_manifest(self):
+        tmp_path = self._path(self.manifest_name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path(self.manifest_name))
@@ -0,0 +1,85 @@
+import json
+import logging
+import os
+import sqlite3
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from blocket.db import IdCache, rebuild_company_stats, update_job
+from blocket.items import JobItem
+from blocket.pipelines import JobPipeline
+from blocket.spiders.blocket import PageType, parse_job_body
+
+
+logger = logging.getLogger(__name__)
+
+
+def parse_archived_page(page: tuple) -> dict | None:
+    """
+    Runs the job page parsing and JobPipeline for one archived page.
+    Dates without a year are completed with the year when the page was archived, not the current one.
+    Executed in worker processes, so it gets and returns only plain data.
+    """
+    url, encoding, body, archived_date, save_description = page
+    try:
+        item = JobItem(parse_job_body(url, zlib.decompress(body), encoding or 'utf-8', save_description))
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        logger.error(f"Error during parsing archived page: {e}, url: {url}")
+        return None
+    if not item:
+        return None
+    relative_base = datetime.strptime(archived_date, "%Y-%m-%d %H:%M:%S") if archived_date else None
+    return dict(JobPipeline(relative_base).process_item(item, None))
+
+
+def reparse_archive(connection: sqlite3.Connection, archive_file: str, processes: int | None = None,
+                    batch_size: int = 500, save_description: bool = True) -> dict:
+    """
+    Parses all archived job pages again with a process pool and updates the jobs table in bulk.
+    Pages are read in batches of batch_size rows, so memory doesn't depend on the archive size.
+    Only jobs that are in the jobs table are updated, jobs moved to the archive database stay there.
+    """
+    processes = processes or os.cpu_count()
+    archive = sqlite3.connect(archive_file)
+    result = {"pages": 0, "jobs_updated": 0, "jobs_skipped": 0, "pages_failed": 0}
+    last_rowid = 0
+    id_cache = IdCache()
+    try:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            while True:
+                rows = archive.execute('''
+                SELECT rowid, url, encoding, body, archived_date FROM page_archive
+                WHERE page_type = ? AND rowid > ?
+                ORDER BY rowid
+                LIMIT ?
+                ''', (PageType.JOB_PAGE.value, last_rowid, batch_size)).fetchall()
+                if not rows:
+                    break
+                last_rowid = rows[-1][0]
+                pages = [(url, encoding, body, archived_date, save_description)
+                         for _, url, encoding, body, archived_date in rows]
+                chunksize = max(1, len(pages) // (processes * 4))
+                jobs = [job for job in executor.map(parse_archived_page, pages, chunksize=chunksize) if job]
+                cursor = connection.cursor()
+                updated = 0
+                try:
+                    for job in jobs:
+                        updated += update_job(cursor, job, id_cache)
+                    connection.commit()
+                    id_cache.commit()
+                except sqlite3.Error:
+                    connection.rollback()
+                    id_cache.rollback()
+                    raise
+                finally:
+                    cursor.close()
+                result["pages"] += len(rows)
+                result["jobs_updated"] += updated
+                result["jobs_skipped"] += len(jobs) - updated
+                result["pages_failed"] += len(rows) - len(jobs)
+                logger.info(f"Reparsed {result['pages']} pages")
+    finally:
+        archive.close()
+    rebuild_company_stats(connection)
+    return result
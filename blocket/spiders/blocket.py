@@ -1,7 +1,10 @@
+import asyncio
 import json
 import logging
+import multiprocessing
 import signal
 import sqlite3
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from typing import Any
 import scrapy
@@ -10,9 +13,12 @@ import dateparser
 from scrapy import Spider, signals
 from enum import Enum
 from scrapy.crawler import Crawler
+from scrapy.http import HtmlResponse
 from scrapy.spidermiddlewares.httperror import HttpError
 from twisted.internet.error import TCPTimedOutError
 
+from blocket.extensions import trace_span
+from blocket.fingerprints import get_fingerprint_service
 from blocket.items import JobItem
 
 
@@ -22,6 +28,60 @@ class PageType(Enum):
     JOB_PAGE = "job_page"
 
 
+def extract_job_fields(response, save_description: bool) -> dict:
+    """
+    The function retrieves job fields from the job page.
+    It doesn't use the spider, so it can be called for archived pages and in other processes.
+    Raises json.JSONDecodeError or KeyError if JSON with job data is broken
+    """
+    fields = {}
+    json_str = response.css('#__NEXT_DATA__::text').get()
+    json_data = json.loads(json_str)
+    if json_data:
+        job_data = {}
+        for k, v in json_data["props"]["pageProps"]["initialApolloState"]["ROOT_QUERY"].items():
+            if isinstance(v, dict) and (ref := v.get("__ref")):
+                job_data = json_data["props"]["pageProps"]["initialApolloState"][ref]
+                break
+        if job_data:
+            fields['url'] = response.url
+            fields['title'] = job_data.get("subject")
+            fields['company'] = job_data.get("corpName")
+            fields['published_date'] = job_data.get("publishedDate")
+            fields['apply_date'] = job_data.get("applyDate")
+            fields['location'] = job_data.get("areaName")
+            fields['category'] = job_data.get("categoryName")
+            fields['job_type'] = job_data.get("employmentName")
+            fields['phone'] = job_data.get("phone")
+            fields['email'] = job_data.get("email")
+            if save_description:
+                # fields['description'] = job_data.get("bodyHtml") # get with HTML tags from JSON
+                fields['description'] = response.css("div.sc-d56e3ac2-5.sc-5fe98a8b-10.brdyEP *::text").getall()
+    return fields
+
+
+def parse_job_body(url: str, body: bytes, encoding: str, save_description: bool) -> dict:
+    """
+    Retrieves job fields from the raw body of the job page.
+    Used in worker processes, so it gets and returns only plain data.
+    """
+    response = HtmlResponse(url=url, body=body, encoding=encoding)
+    return extract_job_fields(response, save_description)
+
+
+def create_parse_executor(processes: int) -> ProcessPoolExecutor | None:
+    """
+    Process pool for parse_job_body, None if processes is 0.
+    Workers are started lazily on the first submit, when the reactor thread pool is already running,
+    and forking a multi-threaded process can deadlock. So they are started by a fork server (spawned where
+    it is not available), which re-imports the __main__ script: scripts starting crawls need a __main__ guard.
+    """
+    if processes <= 0:
+        return None
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context(method))
+
+
 class BlocketSpider(scrapy.Spider):
     name = 'blocket'
 
@@ -31,6 +91,13 @@ class BlocketSpider(scrapy.Spider):
         bot_name = self.settings.get('BOT_NAME', 'scrapy_project')
         self._logger = logging.getLogger(bot_name)
         self.refresh_mode = crawler.settings.getbool("REFRESH_MODE", False)
+        # JOB_PARSE_PROCESSES > 0 - job pages are parsed in a process pool instead of the reactor thread
+        parse_processes = crawler.settings.getint("JOB_PARSE_PROCESSES", 0)
+        # In daemon mode the pool is created once and shared by all crawls
+        self.shared_parse_executor = getattr(crawler, "parse_executor", None)
+        self.parse_executor = self.shared_parse_executor or create_parse_executor(parse_processes)
+        self.parse_max_pending = crawler.settings.getint("JOB_PARSE_MAX_PENDING", 0) or parse_processes * 4
+        self._parse_semaphore = None
         self.logger.info("Start spider")
 
     @property
@@ -40,6 +107,8 @@ class BlocketSpider(scrapy.Spider):
     @classmethod
     def from_crawler(cls, crawler, *args, **kwargs):
         spider = cls(crawler, *args, **kwargs)
+        if spider.parse_executor and not spider.shared_parse_executor:
+            crawler.signals.connect(spider.shutdown_parse_executor, signal=signals.spider_closed)
         return spider
 
     def start_requests(self):
@@ -164,32 +233,14 @@ class BlocketSpider(scrapy.Spider):
         """
         meta = response.meta
         self.logger.info(f"Parsing job {meta.get('link_number')} from {meta.get('category')} page {meta.get('page_number')} {response.url}")
+        if self.parse_executor:
+            return self._parse_job_page_in_pool(response)
+        return self._parse_job_page(response)
 
+    def _parse_job_page(self, response):
         item = JobItem()
-        json_str = response.css('#__NEXT_DATA__::text').get()
         try:
-            json_data = json.loads(json_str)
-            if json_data:
-                job_data = {}
-                for k, v in json_data["props"]["pageProps"]["initialApolloState"]["ROOT_QUERY"].items():
-                    if isinstance(v, dict) and (ref := v.get("__ref")):
-                        job_data = json_data["props"]["pageProps"]["initialApolloState"][ref]
-                        break
-                if job_data:
-                    item['url'] = response.url
-                    item['title'] = job_data.get("subject")
-                    item['company'] = job_data.get("corpName")
-                    item['published_date'] = job_data.get("publishedDate")
-                    item['apply_date'] = job_data.get("applyDate")
-                    item['location'] = job_data.get("areaName")
-                    item['category'] = job_data.get("categoryName")
-                    item['job_type'] = job_data.get("employmentName")
-                    item['phone'] = job_data.get("phone")
-                    item['email'] = job_data.get("email")
-                    if self.settings.get('SAVE_JOB_DESCRIPTION'):
-                        # item['description'] = job_data.get("bodyHtml") # get with HTML tags from JSON
-                        item['description'] = response.css("div.sc-d56e3ac2-5.sc-5fe98a8b-10.brdyEP *::text").getall()
-
+            item.update(extract_job_fields(response, self.settings.getbool('SAVE_JOB_DESCRIPTION')))
         except json.JSONDecodeError as e:
             self.logger.error(f"Error during loading JSON: {e}, url: {response.url}")
         except KeyError as e:
@@ -211,6 +262,39 @@ class BlocketSpider(scrapy.Spider):
         # if item:
         #     yield item
 
+    async def _parse_job_page_in_pool(self, response) -> list:
+        """
+        Parses the job page in the process pool and creates the item in the reactor thread.
+        No more than JOB_PARSE_MAX_PENDING pages are sent to the pool at once, the others wait here.
+        Waiting responses are counted by Scrapy in SCRAPER_SLOT_MAX_ACTIVE_SIZE, so downloads are paused
+        when parsing can't keep up.
+        """
+        if self._parse_semaphore is None:
+            self._parse_semaphore = asyncio.Semaphore(self.parse_max_pending)
+        tracer = getattr(self.crawler, "tracer", None)
+        fp = get_fingerprint_service(self.crawler).fingerprint(response.request) if tracer else None
+        # The span of the middleware would measure only iterating the ready list
+        response.meta['callback_traced'] = True
+        item = JobItem()
+        async with self._parse_semaphore:
+            try:
+                with trace_span(tracer, "spider.callback", fp, response.url,
+                                page_type=response.meta.get('page_type'), pool=True):
+                    future = self.parse_executor.submit(
+                        parse_job_body, response.url, response.body, response.encoding,
+                        self.settings.getbool('SAVE_JOB_DESCRIPTION')
+                    )
+                    fields = await asyncio.wrap_future(future)
+                item.update(fields)
+            except json.JSONDecodeError as e:
+                self.logger.error(f"Error during loading JSON: {e}, url: {response.url}")
+            except KeyError as e:
+                self.logger.error(f"Error during parsing JSON with job data: {e}, url: {response.url}")
+        return [item] if item else []
+
+    def shutdown_parse_executor(self, spider):
+        self.parse_executor.shutdown(wait=False, cancel_futures=True)
+
     def handle_error(self, failure):
 
         if failure.check(TimeoutError, TCPTimedOutError):
@@ -24,7 +24,9 @@ from blocket.spiders.blocket import BlocketSpider
 from scrapy.crawler import CrawlerProcess
 from scrapy.utils.project import get_project_settings
 
-process = CrawlerProcess(settings=get_project_settings())
-process.crawl("blocket")
-process.start()
+# The guard is required by the job parsing process pool (JOB_PARSE_PROCESSES), its workers import this module
+if __name__ == "__main__":
+    process = CrawlerProcess(settings=get_project_settings())
+    process.crawl("blocket")
+    process.start()
 
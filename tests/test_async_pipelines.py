@@ -0,0 +1,179 @@
+import asyncio
+import gc
+import logging
+import sqlite3
+from types import SimpleNamespace
+
+from scrapy.settings import Settings
+
+from blocket.async_pipelines import AsyncDatabasePipeline
+from blocket.db import IdCache, init_db, insert_job
+
+ITEMS = 1000
+# Items processed in parallel, as Scrapy's CONCURRENT_ITEMS
+CONCURRENT_ITEMS = 100
+# The event loop is responsive if the monitor wakes up at least MIN_MONITOR_TICKS times while the items
+# are stored and never later than MAX_LOOP_LAG_SECONDS. BlockingDatabasePipeline must fail both checks
+MIN_MONITOR_TICKS = 50
+MAX_LOOP_LAG_SECONDS = 0.05
+
+
+def make_item(i: int) -> dict:
+    return {
+        "url": f"https://jobb.blocket.se/ledigt-jobb-i-stockholm/id-{i}",
+        "title": f"Utvecklare {i}",
+        "company": f"Företag {i % 20}",
+        "published_date": "2024-05-01",
+        "apply_date": "2024-06-01",
+        "location": f"Ort {i % 7}",
+        "category": "Data & IT, Teknik" if i % 2 else "Data & IT",
+        "job_type": "Heltid",
+        "description": "Beskrivning " * 50,
+        "processed_date": "2024-05-02 10:00:00",
+        "phone": None,
+        "email": None,
+        "additional_contacts": None,
+    }
+
+
+def create_db(path) -> str:
+    connection = sqlite3.connect(path)
+    init_db(connection)
+    connection.close()
+    return str(path)
+
+
+def read_db(db_file: str) -> dict:
+    connection = sqlite3.connect(db_file)
+    try:
+        return {
+            "jobs": connection.execute(
+                "SELECT url, title, company, location, category, job_type FROM jobs_view ORDER BY url").fetchall(),
+            "company_stats": connection.execute(
+                "SELECT company_id, jobs_count, first_seen_date, last_seen_date FROM company_stats "
+                "ORDER BY company_id").fetchall(),
+            "company_category_stats": connection.execute(
+                "SELECT * FROM company_category_stats ORDER BY company_id, category_id").fetchall(),
+            "company_location_stats": connection.execute(
+                "SELECT * FROM company_location_stats ORDER BY company_id, location_id").fetchall(),
+        }
+    finally:
+        connection.close()
+
+
+class BlockingDatabasePipeline(AsyncDatabasePipeline):
+    """Control: writes on the event loop, the lag test must fail with it"""
+
+    async def process_item(self, item, spider):
+        self._store_item(item)
+        return item
+
+
+async def monitor_loop_lag(stop: asyncio.Event, interval: float = 0.001) -> tuple[float, int]:
+    """Returns the maximum delay of asyncio.sleep wake ups and the number of wake ups"""
+    loop = asyncio.get_running_loop()
+    max_lag = 0.0
+    ticks = 0
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        max_lag = max(max_lag, loop.time() - start - interval)
+        ticks += 1
+    return max_lag, ticks
+
+
+async def store_items(pipeline_cls, db_file: str, items: list[dict]) -> tuple[float, int]:
+    """Stores the items concurrently while the loop lag is monitored"""
+    pipeline = pipeline_cls(SimpleNamespace(settings=Settings({"SQLITE_FILE": db_file})))
+    spider = SimpleNamespace(logger=logging.getLogger("test"))
+    semaphore = asyncio.Semaphore(CONCURRENT_ITEMS)
+
+    async def store_item(item):
+        async with semaphore:
+            await pipeline.process_item(item, spider)
+
+    await pipeline._open()
+    # A collection of the test data would be counted as lag of the pipeline
+    gc.collect()
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(stop))
+    # Let the monitor start before the items
+    await asyncio.sleep(0)
+    try:
+        await asyncio.gather(*(store_item(item) for item in items))
+    finally:
+        stop.set()
+        result = await monitor
+        await pipeline._close()
+    return result
+
+
+def loop_is_responsive(max_lag: float, ticks: int) -> bool:
+    return ticks >= MIN_MONITOR_TICKS and max_lag < MAX_LOOP_LAG_SECONDS
+
+
+def test_async_database_pipeline_does_not_block_event_loop(tmp_path):
+    items = [make_item(i) for i in range(ITEMS)]
+    control_db = create_db(tmp_path / "blocking.db")
+    control_lag, control_ticks = asyncio.run(store_items(BlockingDatabasePipeline, control_db, items))
+    assert control_lag >= MAX_LOOP_LAG_SECONDS and control_ticks < MIN_MONITOR_TICKS, (control_lag, control_ticks)
+
+    db_file = create_db(tmp_path / "async.db")
+    max_lag, ticks = asyncio.run(store_items(AsyncDatabasePipeline, db_file, items))
+
+    assert loop_is_responsive(max_lag, ticks), (max_lag, ticks)
+    assert len(read_db(db_file)["jobs"]) == ITEMS
+
+
+def test_async_and_sync_write_paths_store_same_rows(tmp_path):
+    items = [make_item(i) for i in range(60)]
+    async_db = create_db(tmp_path / "async.db")
+    asyncio.run(store_items(AsyncDatabasePipeline, async_db, items))
+
+    sync_db = create_db(tmp_path / "sync.db")
+    connection = sqlite3.connect(sync_db)
+    id_cache = IdCache()
+    for item in items:
+        insert_job(connection.cursor(), item, id_cache)
+        connection.commit()
+        id_cache.commit()
+    connection.close()
+
+    assert read_db(async_db) == read_db(sync_db)
+
+
+def test_sync_writes_on_event_loop_do_not_wait_for_item_transactions(tmp_path):
+    """The crawler connection is written on the event loop while the pipeline stores items"""
+    db_file = create_db(tmp_path / "async.db")
+    items = [make_item(i) for i in range(ITEMS)]
+    crawler_connection = sqlite3.connect(db_file, timeout=1)
+
+    async def write_visited_urls(stop: asyncio.Event) -> int:
+        writes = 0
+        while not stop.is_set():
+            crawler_connection.execute("INSERT INTO visited_urls (fingerprint, url, status) VALUES (?, ?, 'processed')",
+                                       (f"fp{writes}".encode(), f"url{writes}"))
+            crawler_connection.commit()
+            writes += 1
+            await asyncio.sleep(0.001)
+        return writes
+
+    async def run() -> int:
+        pipeline = AsyncDatabasePipeline(SimpleNamespace(settings=Settings({"SQLITE_FILE": db_file})))
+        spider = SimpleNamespace(logger=logging.getLogger("test"))
+        await pipeline._open()
+        stop = asyncio.Event()
+        writer = asyncio.create_task(write_visited_urls(stop))
+        try:
+            await asyncio.gather(*(pipeline.process_item(item, spider) for item in items))
+        finally:
+            stop.set()
+            writes = await writer
+            await pipeline._close()
+        return writes
+
+    try:
+        assert asyncio.run(asyncio.wait_for(run(), timeout=30)) > 0
+    finally:
+        crawler_connection.close()
+    assert len(read_db(db_file)["jobs"]) == ITEMS